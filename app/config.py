@@ -1,4 +1,5 @@
-from os import getenv
+from os import getenv, getpid
+from socket import gethostname
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,4 +11,84 @@ BOT_TOKEN = getenv("BOT_TOKEN")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL не найден в переменных окружения")
 if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не найден в переменных окружения")
\ No newline at end of file
+    raise ValueError("BOT_TOKEN не найден в переменных окружения")
+
+# Пул соединений с БД
+DB_POOL_SIZE = int(getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(getenv("DB_MAX_OVERFLOW", "10"))
+
+# Фоновая рассылка уведомлений: Telegram допускает около 30 сообщений в секунду на бота
+BROADCAST_RATE = float(getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(getenv("BROADCAST_WORKERS", "8"))
+
+# Кэш недель календаря: число недель в памяти и общий лимит событий в них
+CALENDAR_CACHE_WEEKS = int(getenv("CALENDAR_CACHE_WEEKS", "5000"))
+CALENDAR_CACHE_EVENTS = int(getenv("CALENDAR_CACHE_EVENTS", "100000"))
+
+# Кэш контекста пользователя (членство и роль) между апдейтами
+USER_CACHE_SIZE = int(getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(getenv("USER_CACHE_TTL", "300"))
+
+# Очистка старых событий: 0 — выключена; удаление идёт порциями по EVENT_PURGE_CHUNK событий
+EVENT_RETENTION_DAYS = int(getenv("EVENT_RETENTION_DAYS", "0"))
+EVENT_PURGE_CHUNK = int(getenv("EVENT_PURGE_CHUNK", "1000"))
+
+# Режим приёма апдейтов: polling (по умолчанию) или webhook со встроенным aiohttp-сервером
+BOT_MODE = getenv("BOT_MODE", "polling")
+WEBHOOK_URL = getenv("WEBHOOK_URL")
+WEBHOOK_PATH = getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = getenv("WEBHOOK_SECRET")
+# Адрес Bot API, например локального сервера или заглушки для тестов; по умолчанию api.telegram.org
+TELEGRAM_API_URL = getenv("TELEGRAM_API_URL")
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"Неизвестный BOT_MODE: {BOT_MODE}")
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("WEBHOOK_URL не найден в переменных окружения")
+
+# Догоняющая обработка после перезапуска: размер пачки getUpdates и возраст, после которого колбэки не обрабатываются
+CATCHUP_BATCH = int(getenv("CATCHUP_BATCH", "100"))
+STALE_CALLBACK_AGE = float(getenv("STALE_CALLBACK_AGE", "60"))
+# Как часто сохранять последний обработанный update_id
+OFFSET_FLUSH_INTERVAL = float(getenv("OFFSET_FLUSH_INTERVAL", "5"))
+
+# Хранилище FSM: postgres (таблица fsm_states) или memory; изменения пишутся в базу пачкой раз в FSM_FLUSH_DELAY секунд
+FSM_STORAGE = getenv("FSM_STORAGE", "postgres")
+FSM_CACHE_SIZE = int(getenv("FSM_CACHE_SIZE", "10000"))
+FSM_FLUSH_DELAY = float(getenv("FSM_FLUSH_DELAY", "1"))
+# Сколько секунд состояние FSM держится в памяти и через сколько дней без изменений удаляется из базы (0 — никогда)
+FSM_CACHE_TTL = float(getenv("FSM_CACHE_TTL", "3600"))
+FSM_IDLE_DAYS = int(getenv("FSM_IDLE_DAYS", "14"))
+
+if FSM_STORAGE not in ("postgres", "memory"):
+    raise ValueError(f"Неизвестный FSM_STORAGE: {FSM_STORAGE}")
+
+# Сколько обработчиков работает одновременно; по умолчанию не больше, чем соединений в пуле.
+# С хранилищем FSM в postgres обработчик может держать два соединения: свою сессию и загрузку FSM/UI-флагов
+HANDLER_CONCURRENCY = int(getenv(
+    "HANDLER_CONCURRENCY",
+    str(max(1, (DB_POOL_SIZE + DB_MAX_OVERFLOW) // 2) if FSM_STORAGE == "postgres" else DB_POOL_SIZE + DB_MAX_OVERFLOW),
+))
+
+# Эфемерные флаги интерфейса: сколько держать в памяти и как долго (в режиме cluster они в хранилище FSM)
+UI_FLAGS_SIZE = int(getenv("UI_FLAGS_SIZE", "50000"))
+UI_FLAGS_TTL = float(getenv("UI_FLAGS_TTL", "86400"))
+
+# Несколько процессов бота: single — один процесс; cluster — ведущий принимает апдейты в таблицу update_queue,
+# все процессы обрабатывают её разделы по chat_id
+WORKER_MODE = getenv("WORKER_MODE", "single")
+WORKER_ID = getenv("WORKER_ID") or f"{gethostname()}-{getpid()}"
+UPDATE_PARTITIONS = int(getenv("UPDATE_PARTITIONS", "64"))
+WORKER_PARTITIONS = int(getenv("WORKER_PARTITIONS", "8"))
+PARTITION_LEASE = float(getenv("PARTITION_LEASE", "60"))
+
+if WORKER_MODE not in ("single", "cluster"):
+    raise ValueError(f"Неизвестный WORKER_MODE: {WORKER_MODE}")
+if WORKER_MODE == "cluster" and FSM_STORAGE != "postgres":
+    raise ValueError("WORKER_MODE=cluster требует общего хранилища FSM (FSM_STORAGE=postgres)")
+
+# Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics; 0 — выключены
+METRICS_HOST = getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(getenv("METRICS_PORT", "9100"))
@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+
+@dataclass(frozen=True, slots=True)
+class CurrentGroup:
+    """Группа текущего пользователя."""
+    id: str
+    name: str
+
+@dataclass(frozen=True, slots=True)
+class CurrentMembership:
+    """Членство текущего пользователя в группе."""
+    group: CurrentGroup
+    is_leader: bool
+    is_assistant: bool
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    """Неизменяемый снимок пользователя, его членства и группы на время одного апдейта.
+
+    Повторяет форму User.group_membership.group, чтобы обработчики читали его
+    так же, как ORM-объект, но не держит сессию и не подгружает связи лениво.
+    """
+    telegram_id: int
+    first_name: str
+    last_name: str | None
+    middle_name: str | None
+    telegram_username: str | None
+    group_membership: CurrentMembership | None = None
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Index, ForeignKey, Boolean, Date, BigInteger, text, Integer
+from sqlalchemy import Column, String, Text, DateTime, Index, ForeignKey, Boolean, Date, BigInteger, text, Integer, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, DeclarativeBase
@@ -81,6 +81,11 @@ class Event(Base):
     
     group = relationship("Group", back_populates="events")
     topic_lists = relationship("TopicList", back_populates="event", cascade="all, delete-orphan")
+    queue = relationship("Queue", back_populates="event", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index('idx_events_group_id_date', 'group_id', 'date'),
+    )
 
 class Invite(Base):
     __tablename__ = "groupinvitations"
@@ -158,4 +163,123 @@ class TopicSelection(Base):
     )
 
     def __repr__(self):
-        return f"<TopicSelection(id={self.id}, topic_id={self.topic_id}, user_id={self.user_id})>"
\ No newline at end of file
+        return f"<TopicSelection(id={self.id}, topic_id={self.topic_id}, user_id={self.user_id})>"
+
+
+class Queue(Base):
+    """Модель очереди на защиту, привязанной к событию."""
+    __tablename__ = 'queues'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=func.uuid_generate_v4())
+    event_id = Column(UUID(as_uuid=True), ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    title = Column(String(255), nullable=False, doc="Название очереди")
+    description = Column(String(1000), nullable=True, doc="Описание очереди")
+    max_participants = Column(Integer, nullable=True, doc="Максимальное количество мест в очереди")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), doc="Дата и время создания")
+
+    event = relationship("Event", back_populates="queue")
+    participants = relationship("QueueParticipant", back_populates="queue", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index('idx_queues_event_id', 'event_id', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<Queue(id={self.id}, event_id={self.event_id}, max_participants={self.max_participants})>"
+
+class QueueParticipant(Base):
+    """Модель места участника в очереди."""
+    __tablename__ = 'queueparticipants'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=func.uuid_generate_v4())
+    queue_id = Column(UUID(as_uuid=True), ForeignKey('queues.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(BigInteger, ForeignKey('users.telegram_id', ondelete='CASCADE'), nullable=False)
+    position = Column(Integer, nullable=False, doc="Позиция в очереди")
+    joined_at = Column(DateTime(timezone=True), server_default=func.now(), doc="Дата и время записи в очередь")
+
+    queue = relationship("Queue", back_populates="participants")
+
+    __table_args__ = (
+        UniqueConstraint('queue_id', 'position', name='queueparticipants_queue_id_position_key'),
+        UniqueConstraint('queue_id', 'user_id', name='queueparticipants_queue_id_user_id_key'),
+    )
+
+    def __repr__(self):
+        return f"<QueueParticipant(queue_id={self.queue_id}, user_id={self.user_id}, position={self.position})>"
+
+class OutboxMessage(Base):
+    """Модель исходящего уведомления, ожидающего доставки (transactional outbox)."""
+    __tablename__ = 'notification_outbox'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    idempotency_key = Column(String(255), nullable=False, unique=True, doc="Ключ, защищающий от повторной постановки одного уведомления")
+    chat_id = Column(BigInteger, nullable=False, doc="Получатель уведомления")
+    body = Column(Text, nullable=False, doc="Текст сообщения")
+    reply_markup = Column(JSONB, nullable=True, doc="Клавиатура сообщения в сериализованном виде")
+    status = Column(String(20), nullable=False, server_default=text("'pending'"), doc="pending, sent или dead")
+    attempts = Column(Integer, nullable=False, server_default=text("0"), doc="Количество неудачных попыток доставки")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), doc="Не раньше этого времени будет следующая попытка")
+    last_error = Column(Text, nullable=True, doc="Последняя ошибка доставки")
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('idx_outbox_pending', 'next_attempt_at', postgresql_where=text("status = 'pending'")),
+    )
+
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, chat_id={self.chat_id}, status='{self.status}')>"
+
+class BotOffset(Base):
+    """Последний обработанный update_id бота (переживает перезапуски)."""
+    __tablename__ = 'bot_offsets'
+
+    bot_id = Column(BigInteger, primary_key=True, doc="Идентификатор бота в Telegram")
+    update_id = Column(BigInteger, nullable=False, doc="Все апдейты с update_id не больше этого уже обработаны")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<BotOffset(bot_id={self.bot_id}, update_id={self.update_id})>"
+
+class FsmRecord(Base):
+    """Состояние и данные FSM одного ключа aiogram (пользователь в чате)."""
+    __tablename__ = 'fsm_states'
+
+    key = Column(String(255), primary_key=True, doc="Ключ, собранный DefaultKeyBuilder")
+    state = Column(String(255), nullable=True, doc="Текущее состояние")
+    data = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"), doc="Данные FSM")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('idx_fsm_states_updated_at', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f"<FsmRecord(key='{self.key}', state='{self.state}')>"
+
+class QueuedUpdate(Base):
+    """Апдейт Telegram, принятый ведущим процессом и ожидающий обработки воркером."""
+    __tablename__ = 'update_queue'
+
+    update_id = Column(BigInteger, primary_key=True, doc="update_id от Telegram; повторная доставка не создаёт дубль")
+    partition = Column(Integer, nullable=False, doc="Раздел по chat_id: апдейты одного раздела обрабатывает один воркер")
+    payload = Column(JSONB, nullable=False, doc="Апдейт в JSON")
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_update_queue_partition', 'partition', 'update_id'),
+    )
+
+    def __repr__(self):
+        return f"<QueuedUpdate(update_id={self.update_id}, partition={self.partition})>"
+
+class UpdatePartition(Base):
+    """Аренда раздела очереди апдейтов воркером."""
+    __tablename__ = 'update_partitions'
+
+    partition = Column(Integer, primary_key=True)
+    owner = Column(String(255), nullable=True, doc="Воркер, который сейчас обрабатывает раздел")
+    lease_until = Column(DateTime(timezone=True), nullable=True, doc="После этого момента раздел может забрать другой воркер")
+
+    def __repr__(self):
+        return f"<UpdatePartition(partition={self.partition}, owner='{self.owner}')>"
@@ -1,35 +1,95 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import delete, update, text
-from app.db.models import User, Group, GroupMember, Event, Invite, TopicList, Topic
-from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY
+from sqlalchemy import delete, update, insert, text, func, exists, literal, values, column, cast, String, Text
+from app.db.models import User, Group, GroupMember, Event, Invite, TopicList, Topic, Queue, QueueParticipant, OutboxMessage
+from datetime import datetime, timedelta, date
 import uuid
 import logging
+from contextlib import asynccontextmanager
 import json
-from aiogram import Bot  # Импортируем Bot
+from sqlalchemy import event as sa_event
+from app.services.outbox import OutboxWorker, serialize_markup
+from app.services.cache import CalendarCache, CalendarEvent, UserContextCache
+from app.db.context import CurrentUser, CurrentMembership, CurrentGroup
 
 logger = logging.getLogger(__name__)
 
-class UserRepo:
-    def __init__(self, session: AsyncSession):
+def format_full_name(last_name: str | None, first_name: str, middle_name: str | None) -> str:
+    """Собирает ФИО в том виде, в котором оно показывается в списках."""
+    return f"{last_name or ''} {first_name} {middle_name or ''}".strip()
+
+class BaseRepo:
+    """Общая логика транзакций репозиториев.
+
+    По умолчанию каждый метод сам коммитит свою работу. Внутри
+    `async with repo.transaction():` методы всех репозиториев этой сессии
+    только пишут в общую транзакцию: _commit и _rollback ничего не делают,
+    коммит (или откат) выполняется один раз на выходе из блока, а сброс кэшей
+    откладывается до успешного коммита.
+    """
+    session: AsyncSession
+
+    @property
+    def in_transaction(self) -> bool:
+        return bool(self.session.info.get("unit_of_work"))
+
+    @asynccontextmanager
+    async def transaction(self):
+        if self.in_transaction:
+            # Вложенный блок — часть внешней транзакции
+            yield
+            return
+        self.session.info["unit_of_work"] = True
+        self.session.info["after_commit"] = []
+        try:
+            yield
+            await self.session.commit()
+        except BaseException:
+            await self.session.rollback()
+            raise
+        finally:
+            self.session.info.pop("unit_of_work", None)
+            callbacks = self.session.info.pop("after_commit", [])
+        for callback in callbacks:
+            callback()
+
+    async def _commit(self):
+        if not self.in_transaction:
+            await self.session.commit()
+
+    async def _rollback(self):
+        if not self.in_transaction:
+            await self.session.rollback()
+
+    def _after_commit(self, callback, *args):
+        """Выполняет callback сразу или, внутри transaction(), после её коммита."""
+        if self.in_transaction:
+            self.session.info["after_commit"].append(lambda: callback(*args))
+        else:
+            callback(*args)
+
+class UserRepo(BaseRepo):
+    def __init__(self, session: AsyncSession, user_cache: UserContextCache):
         self.session = session
+        self.user_cache = user_cache  # Общий для всех сессий кэш CurrentUser
 
     async def get_or_create_user(self, telegram_id: int, username: str | None, first_name: str | None, last_name: str | None) -> User:
+        """Возвращает пользователя, создавая его при первом обращении.
+
+        INSERT ... ON CONFLICT DO UPDATE отрабатывает одним запросом и для нового,
+        и для существующего пользователя (у него обновляется last_active_at),
+        поэтому двойной /start не приводит к ошибке уникальности. Членство с
+        группой подгружается вторым запросом.
+        """
         try:
             logger.info(f"Попытка получить пользователя с telegram_id={telegram_id}")
-            stmt = (
-                select(User)
-                .options(selectinload(User.group_membership).selectinload(GroupMember.group))
-                .where(User.telegram_id == telegram_id)
-            )
-            result = await self.session.execute(stmt)
-            user = result.scalar_one_or_none()
-
-            if not user:
-                logger.info(f"Пользователь не найден, создаём нового: telegram_id={telegram_id}")
-                user = User(
+            upsert = (
+                pg_insert(User)
+                .values(
                     telegram_id=telegram_id,
                     telegram_username=username,
                     first_name=first_name or "Неизвестно",
@@ -37,21 +97,29 @@ class UserRepo:
                     middle_name=None,
                     notification_settings={}
                 )
-                self.session.add(user)
-                await self.session.commit()
-                logger.info("Пользователь добавлен в сессию и коммит выполнен")
-                await self.session.refresh(user)
-                stmt = (
-                    select(User)
-                    .options(selectinload(User.group_membership).selectinload(GroupMember.group))
-                    .where(User.telegram_id == telegram_id)
+                .on_conflict_do_update(
+                    index_elements=[User.telegram_id],
+                    set_={"last_active_at": func.now()}
                 )
-                result = await self.session.execute(stmt)
-                user = result.scalar_one_or_none()
-                logger.info("Пользователь обновлён с отношением")
+                .returning(User)
+            )
+            result = await self.session.execute(
+                select(User).from_statement(upsert).execution_options(populate_existing=True)
+            )
+            user = result.scalar_one()
+
+            stmt = (
+                select(GroupMember)
+                .options(joinedload(GroupMember.group))
+                .where(GroupMember.user_id == telegram_id)
+            )
+            result = await self.session.execute(stmt)
+            set_committed_value(user, "group_membership", result.scalar_one_or_none())
+            await self._commit()
             return user
         except Exception as e:
             logger.error(f"Ошибка при получении/создании пользователя: {e}", exc_info=True)
+            await self._rollback()
             raise
 
     async def get_user_with_group_info(self, telegram_id: int) -> User | None:
@@ -69,6 +137,56 @@ class UserRepo:
             logger.error(f"Ошибка при получении пользователя с группой: {e}")
             return None
 
+    async def get_current_user(self, telegram_id: int) -> CurrentUser | None:
+        """Пользователь с членством и группой одним запросом (users LEFT JOIN groupmembers LEFT JOIN groups).
+
+        Найденный контекст кэшируется между апдейтами; незарегистрированные пользователи не кэшируются.
+        """
+        cached = self.user_cache.get(telegram_id)
+        if cached is not None:
+            return cached
+        version = self.user_cache.version
+        try:
+            stmt = (
+                select(
+                    User.telegram_id,
+                    User.first_name,
+                    User.last_name,
+                    User.middle_name,
+                    User.telegram_username,
+                    GroupMember.is_leader,
+                    GroupMember.is_assistant,
+                    Group.id.label("group_id"),
+                    Group.name.label("group_name")
+                )
+                .outerjoin(GroupMember, GroupMember.user_id == User.telegram_id)
+                .outerjoin(Group, Group.id == GroupMember.group_id)
+                .where(User.telegram_id == telegram_id)
+            )
+            row = (await self.session.execute(stmt)).first()
+            if not row:
+                return None
+            membership = None
+            if row.group_id is not None:
+                membership = CurrentMembership(
+                    group=CurrentGroup(id=str(row.group_id), name=row.group_name),
+                    is_leader=row.is_leader,
+                    is_assistant=row.is_assistant
+                )
+            current_user = CurrentUser(
+                telegram_id=row.telegram_id,
+                first_name=row.first_name,
+                last_name=row.last_name,
+                middle_name=row.middle_name,
+                telegram_username=row.telegram_username,
+                group_membership=membership
+            )
+            self.user_cache.put(telegram_id, current_user, version)
+            return current_user
+        except Exception as e:
+            logger.error(f"Ошибка при получении контекста пользователя: {e}")
+            raise
+
     async def update_user(self, telegram_id: int, first_name: str, last_name: str, middle_name: str | None, username: str) -> User:
         try:
             stmt = (
@@ -86,12 +204,13 @@ class UserRepo:
             user = result.scalar_one_or_none()
             if not user:
                 raise ValueError(f"Пользователь с telegram_id={telegram_id} не найден")
-            await self.session.commit()
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, telegram_id)
             logger.info(f"Пользователь {telegram_id} обновлён: {first_name} {last_name} {middle_name or ''}")
             return user
         except Exception as e:
             logger.error(f"Ошибка при обновлении пользователя: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def check_full_name_exists(self, last_name: str, first_name: str, middle_name: str | None) -> bool:
@@ -113,196 +232,259 @@ class UserRepo:
 
     async def create_queue(self, event_id: str, max_slots: int) -> bool:
         try:
-            event = await self.session.execute(select(Event).where(Event.id == event_id))
-            event = event.scalar_one_or_none()
-            if not event:
-                raise ValueError(f"Событие с event_id={event_id} не найдено")
-
-            stmt = select(GroupMember).where(GroupMember.group_id == event.group_id)
+            stmt = (
+                insert(Queue)
+                .from_select(
+                    ["event_id", "title", "max_participants"],
+                    select(Event.id, Event.title, literal(max_slots)).where(Event.id == event_id)
+                )
+                .returning(Queue.id)
+            )
             result = await self.session.execute(stmt)
-            members = result.scalars().all()
-
-            for member in members:
-                user = await self.get_user_with_group_info(member.user_id)
-                if user:
-                    notification_settings = user.notification_settings or {}
-                    notification_settings[str(event_id)] = {
-                        "max_slots": max_slots,
-                        "entries": {}
-                    }
-                    await self.session.execute(
-                        update(User)
-                        .where(User.telegram_id == user.telegram_id)
-                        .values(notification_settings=notification_settings)
-                    )
-            await self.session.commit()
+            if result.scalar_one_or_none() is None:
+                raise ValueError(f"Событие с event_id={event_id} не найдено")
+            await self._commit()
             logger.info(f"Очередь для события event_id={event_id} создана с max_slots={max_slots}")
             return True
         except Exception as e:
             logger.error(f"Ошибка при создании очереди: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
+    def _queue_state_stmt(self, event_id: str, user_id: int):
+        """Одним запросом собирает событие, его очередь и положение пользователя относительно неё."""
+        taken = (
+            select(func.count(QueueParticipant.id))
+            .where(QueueParticipant.queue_id == Queue.id)
+            .correlate(Queue)
+            .scalar_subquery()
+        )
+        is_in_queue = (
+            exists()
+            .where(QueueParticipant.queue_id == Queue.id, QueueParticipant.user_id == user_id)
+            .correlate(Queue)
+        )
+        is_member = (
+            exists()
+            .where(GroupMember.group_id == Event.group_id, GroupMember.user_id == user_id)
+            .correlate(Event)
+        )
+        return (
+            select(
+                Queue.id.label("queue_id"),
+                Queue.max_participants,
+                taken.label("taken"),
+                is_in_queue.label("is_in_queue"),
+                is_member.label("is_member")
+            )
+            .select_from(Event)
+            .outerjoin(Queue, Queue.event_id == Event.id)
+            .where(Event.id == event_id)
+        )
+
+    async def _lock_queue(self, event_id: str):
+        """Берёт блокировку строки очереди до конца транзакции, сериализуя запись в очередь одного события."""
+        stmt = (
+            select(Queue.id, Queue.max_participants)
+            .where(Queue.event_id == event_id)
+            .with_for_update()
+        )
+        result = await self.session.execute(stmt)
+        return result.one_or_none()
+
+    async def _explain_queue_refusal(self, event_id: str, user_id: int) -> tuple[str, bool]:
+        """Определяет причину, по которой запись или выход из очереди не состоялись."""
+        result = await self.session.execute(self._queue_state_stmt(event_id, user_id))
+        queue_state = result.one_or_none()
+        if not queue_state:
+            return "Событие не найдено", False
+        if not queue_state.is_member:
+            return "Вы не состоите в группе этого события", False
+        if queue_state.queue_id is None:
+            return "Очередь для этого события не создана", False
+        if queue_state.is_in_queue:
+            return "Вы уже заняли место в очереди", True
+        if queue_state.max_participants is not None and queue_state.taken >= queue_state.max_participants:
+            return "Все места в очереди заняты", False
+        return "Вы не записаны в очередь", False
+
     async def join_queue(self, event_id: str, user_id: int) -> tuple[bool, str, bool]:
         """Добавляет пользователя в очередь для события, возвращая статус нахождения в очереди."""
         try:
-            event = await self.session.execute(select(Event).where(Event.id == event_id))
-            event = event.scalar_one_or_none()
-            if not event:
-                return False, "Событие не найдено", False
-
-            stmt = select(GroupMember).where(GroupMember.group_id == event.group_id, GroupMember.user_id == user_id)
-            result = await self.session.execute(stmt)
-            member = result.scalar_one_or_none()
-            if not member:
-                return False, "Вы не состоите в группе этого события", False
-
-            stmt = select(GroupMember).where(GroupMember.group_id == event.group_id)
-            result = await self.session.execute(stmt)
-            members = result.scalars().all()
-
-            queue_data = None
-            for member in members:
-                user = await self.get_user_with_group_info(member.user_id)
-                if user and user.notification_settings and str(event_id) in user.notification_settings:
-                    queue_data = user.notification_settings[str(event_id)]
-                    break
-            if not queue_data:
-                return False, "Очередь для этого события не создана", False
-
-            is_in_queue = False
-            for position, queued_user_id in queue_data["entries"].items():
-                if int(queued_user_id) == user_id:
-                    is_in_queue = True
-                    return False, "Вы уже заняли место в очереди", is_in_queue
-
-            current_entries = len(queue_data["entries"])
-            max_slots = queue_data["max_slots"]
-            if current_entries >= max_slots:
-                return False, "Все места в очереди заняты", is_in_queue
-
-            position = current_entries + 1
-            queue_data["entries"][str(position)] = user_id
-
-            for member in members:
-                user = await self.get_user_with_group_info(member.user_id)
-                if user:
-                    notification_settings = user.notification_settings or {}
-                    notification_settings[str(event_id)] = queue_data
-                    await self.session.execute(
-                        update(User)
-                        .where(User.telegram_id == user.telegram_id)
-                        .values(notification_settings=notification_settings)
-                    )
-            await self.session.commit()
-            logger.info(f"Пользователь user_id={user_id} записан в очередь события event_id={event_id} на позицию {position}")
-            return True, f"Вы записаны на позицию {position}", is_in_queue
+            queue = await self._lock_queue(event_id)
+            if queue:
+                # Под блокировкой очереди новый снимок видит все уже закоммиченные записи,
+                # поэтому подсчёт мест и выдача позиции не могут разойтись
+                taken = (
+                    select(func.count(QueueParticipant.id))
+                    .where(QueueParticipant.queue_id == queue.id)
+                    .scalar_subquery()
+                )
+                last_position = (
+                    select(func.coalesce(func.max(QueueParticipant.position), 0))
+                    .where(QueueParticipant.queue_id == queue.id)
+                    .scalar_subquery()
+                )
+                is_member = exists().where(
+                    GroupMember.user_id == user_id,
+                    GroupMember.group_id == select(Event.group_id).where(Event.id == event_id).scalar_subquery()
+                )
+                source = select(
+                    literal(queue.id, QueueParticipant.queue_id.type),
+                    literal(user_id, QueueParticipant.user_id.type),
+                    last_position + 1
+                ).where(is_member)
+                if queue.max_participants is not None:
+                    source = source.where(taken < queue.max_participants)
+                # Позиции только растут и допускают пропуски после выхода участников;
+                # подзапрос в RETURNING видит снимок до вставки, так что место в очереди = taken + 1
+                stmt = (
+                    pg_insert(QueueParticipant)
+                    .from_select(["queue_id", "user_id", "position"], source)
+                    .on_conflict_do_nothing(index_elements=["queue_id", "user_id"])
+                    .returning((taken + 1).label("place"))
+                )
+                result = await self.session.execute(stmt)
+                place = result.scalar_one_or_none()
+                if place is not None:
+                    await self._commit()
+                    logger.info(f"Пользователь user_id={user_id} записан в очередь события event_id={event_id} на позицию {place}")
+                    return True, f"Вы записаны на позицию {place}", False
+
+            # Снимаем блокировку до диагностики, чтобы не задерживать остальных
+            await self._rollback()
+            message, is_in_queue = await self._explain_queue_refusal(event_id, user_id)
+            return False, message, is_in_queue
         except Exception as e:
             logger.error(f"Ошибка при записи в очередь: {e}")
-            await self.session.rollback()
+            await self._rollback()
             return False, "Произошла ошибка при записи в очередь", False
 
     async def leave_queue(self, event_id: str, user_id: int) -> tuple[bool, str]:
-        """Удаляет пользователя из очереди и пересчитывает позиции."""
+        """Удаляет пользователя из очереди; позиции остальных участников не меняются."""
         try:
-            event = await self.session.execute(select(Event).where(Event.id == event_id))
-            event = event.scalar_one_or_none()
-            if not event:
-                return False, "Событие не найдено"
-
-            stmt = select(GroupMember).where(GroupMember.group_id == event.group_id, GroupMember.user_id == user_id)
-            result = await self.session.execute(stmt)
-            member = result.scalar_one_or_none()
-            if not member:
-                return False, "Вы не состоите в группе этого события"
-
-            stmt = select(GroupMember).where(GroupMember.group_id == event.group_id)
+            stmt = (
+                delete(QueueParticipant)
+                .where(
+                    QueueParticipant.queue_id == Queue.id,
+                    Queue.event_id == event_id,
+                    QueueParticipant.user_id == user_id
+                )
+                .returning(QueueParticipant.position)
+            )
             result = await self.session.execute(stmt)
-            members = result.scalars().all()
+            if result.scalar_one_or_none() is None:
+                message, _ = await self._explain_queue_refusal(event_id, user_id)
+                return False, message
 
-            queue_data = None
-            for member in members:
-                user = await self.get_user_with_group_info(member.user_id)
-                if user and user.notification_settings and str(event_id) in user.notification_settings:
-                    queue_data = user.notification_settings[str(event_id)]
-                    break
-            if not queue_data:
-                return False, "Очередь для этого события не создана"
-
-            user_position = None
-            for position, queued_user_id in queue_data["entries"].items():
-                if int(queued_user_id) == user_id:
-                    user_position = position
-                    break
-
-            if not user_position:
-                return False, "Вы не записаны в очередь"
-
-            del queue_data["entries"][user_position]
-
-            new_entries = {}
-            for pos, uid in sorted(queue_data["entries"].items(), key=lambda x: int(x[0])):
-                new_position = str(int(pos) - 1 if int(pos) > int(user_position) else pos)
-                new_entries[new_position] = uid
-            queue_data["entries"] = new_entries
-
-            for member in members:
-                user = await self.get_user_with_group_info(member.user_id)
-                if user:
-                    notification_settings = user.notification_settings or {}
-                    notification_settings[str(event_id)] = queue_data
-                    await self.session.execute(
-                        update(User)
-                        .where(User.telegram_id == user.telegram_id)
-                        .values(notification_settings=notification_settings)
-                    )
-            await self.session.commit()
+            await self._commit()
             logger.info(f"Пользователь user_id={user_id} удалён из очереди события event_id={event_id}")
             return True, "Вы отказались от места в очереди"
         except Exception as e:
             logger.error(f"Ошибка при удалении из очереди: {e}")
-            await self.session.rollback()
+            await self._rollback()
             return False, "Произошла ошибка при отказе от места"
 
     async def get_queue_entries(self, event_id: str) -> dict:
         try:
-            event = await self.session.execute(select(Event).where(Event.id == event_id))
-            event = event.scalar_one_or_none()
-            if not event:
-                logger.error(f"Событие с event_id={event_id} не найдено")
-                return {}
-
-            stmt = select(GroupMember).where(GroupMember.group_id == event.group_id)
+            stmt = (
+                select(Queue.max_participants, QueueParticipant.position, QueueParticipant.user_id)
+                .outerjoin(QueueParticipant, QueueParticipant.queue_id == Queue.id)
+                .where(Queue.event_id == event_id)
+                .order_by(QueueParticipant.position)
+            )
             result = await self.session.execute(stmt)
-            members = result.scalars().all()
-
-            queue_data = {"max_slots": 0, "entries": {}}
-            found = False
-
-            for member in members:
-                user = await self.get_user_with_group_info(member.user_id)
-                if user and user.notification_settings and str(event_id) in user.notification_settings:
-                    user_queue_data = user.notification_settings[str(event_id)]
-                    if user_queue_data.get("max_slots", 0) > queue_data["max_slots"]:
-                        queue_data["max_slots"] = user_queue_data["max_slots"]
-                    for position, user_id in user_queue_data.get("entries", {}).items():
-                        queue_data["entries"][position] = user_id
-                    found = True
-
-            if not found:
+            rows = result.all()
+            if not rows:
                 logger.info(f"Очередь для события event_id={event_id} не найдена")
                 return {}
 
+            # В базе позиции разрежены, номера 1..k для показа вычисляются здесь
+            queue_data = {"max_slots": rows[0].max_participants or 0, "entries": {}}
+            participants = [row.user_id for row in rows if row.user_id is not None]
+            for place, user_id in enumerate(participants, 1):
+                queue_data["entries"][str(place)] = user_id
             logger.info(f"Очередь для события event_id={event_id} успешно собрана: {queue_data}")
             return queue_data
         except Exception as e:
             logger.error(f"Ошибка при получении данных очереди: {e}")
             return {}
 
-class GroupRepo:
-    def __init__(self, session: AsyncSession, bot: Bot):  # Добавляем bot в конструктор
+    async def get_queue_rows(self, event_id: str) -> dict:
+        """Возвращает очередь вместе с ФИО участников одним запросом."""
+        try:
+            stmt = (
+                select(
+                    Queue.max_participants,
+                    QueueParticipant.user_id,
+                    User.first_name,
+                    User.last_name,
+                    User.middle_name,
+                    User.telegram_username
+                )
+                .outerjoin(QueueParticipant, QueueParticipant.queue_id == Queue.id)
+                .outerjoin(User, User.telegram_id == QueueParticipant.user_id)
+                .where(Queue.event_id == event_id)
+                .order_by(QueueParticipant.position)
+            )
+            result = await self.session.execute(stmt)
+            rows = result.all()
+            if not rows:
+                logger.info(f"Очередь для события event_id={event_id} не найдена")
+                return {}
+
+            participants = [row for row in rows if row.user_id is not None]
+            return {
+                "max_slots": rows[0].max_participants or 0,
+                "entries": [
+                    {
+                        "position": place,
+                        "user_id": row.user_id,
+                        "full_name": format_full_name(row.last_name, row.first_name, row.middle_name),
+                        "telegram_username": row.telegram_username
+                    }
+                    for place, row in enumerate(participants, 1)
+                ]
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при получении очереди с участниками: {e}")
+            return {}
+
+class GroupRepo(BaseRepo):
+    def __init__(self, session: AsyncSession, outbox: OutboxWorker, calendar_cache: CalendarCache, user_cache: UserContextCache):
         self.session = session
-        self.bot = bot  # Сохраняем экземпляр Bot
+        self.outbox = outbox  # Уведомления пишутся в outbox и доставляются воркером после коммита
+        self.calendar_cache = calendar_cache  # Общий для всех сессий кэш недель календаря
+        self.user_cache = user_cache
+
+    async def enqueue_notifications(self, chat_ids, text: str, idempotency_key: str, reply_markup=None):
+        """Добавляет уведомления в outbox в текущей транзакции, не коммитя её.
+
+        Ключ идемпотентности дополняется chat_id: повторная постановка того же
+        уведомления (например, при повторе обработчика) не создаст дубликат.
+        """
+        markup = serialize_markup(reply_markup)
+        rows = [
+            {
+                "idempotency_key": f"{idempotency_key}:{chat_id}",
+                "chat_id": chat_id,
+                "body": text,
+                "reply_markup": markup
+            }
+            for chat_id in dict.fromkeys(chat_ids)
+        ]
+        if not rows:
+            return
+        stmt = pg_insert(OutboxMessage).values(rows).on_conflict_do_nothing(index_elements=["idempotency_key"])
+        await self.session.execute(stmt)
+        if not self.session.info.get("outbox_wake"):
+            self.session.info["outbox_wake"] = True
+
+            def wake_outbox(session):
+                session.info.pop("outbox_wake", None)
+                self.outbox.wake()
+
+            sa_event.listen(self.session.sync_session, "after_commit", wake_outbox, once=True)
 
     async def create_group(self, name: str, creator_id: int) -> Group:
         try:
@@ -321,16 +503,17 @@ class GroupRepo:
                 is_leader=True
             )
             self.session.add(membership)
-            await self.session.commit()
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, creator_id)
             await self.session.refresh(new_group)
             return new_group
         except IntegrityError as e:
             logger.error(f"Ошибка целостности при создании группы: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
         except Exception as e:
             logger.error(f"Ошибка при создании группы: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def get_group_by_id(self, group_id: str) -> Group | None:
@@ -340,82 +523,61 @@ class GroupRepo:
 
     async def add_member(self, group_id: str, user_id: int, is_leader: bool = False):
         try:
-            group = await self.get_group_by_id(group_id)
-            if not group:
-                raise ValueError(f"Группа с ID={group_id} не найдена")
-
-            user_stmt = select(User).where(User.telegram_id == user_id)
-            user_result = await self.session.execute(user_stmt)
-            if not user_result.scalar_one_or_none():
-                raise ValueError(f"Пользователь с telegram_id={user_id} не найден")
-
-            membership = GroupMember(user_id=user_id, group_id=group_id, is_leader=is_leader)
-            self.session.add(membership)
-            await self.session.commit()
+            # Группу и пользователя проверяют внешние ключи, повторное членство — UNIQUE (user_id)
+            await self.session.execute(
+                insert(GroupMember).values(user_id=user_id, group_id=group_id, is_leader=is_leader)
+            )
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, user_id)
         except IntegrityError as e:
             logger.error(f"Ошибка целостности при добавлении участника: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
         except Exception as e:
             logger.error(f"Ошибка при добавлении участника: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def delete_member(self, group_id: str, user_id: int):
         try:
-            stmt = (
-                select(GroupMember)
-                .where(GroupMember.group_id == group_id, GroupMember.user_id == user_id)
-            )
-            result = await self.session.execute(stmt)
-            member = result.scalar_one_or_none()
-            if not member:
-                raise ValueError(f"Участник с user_id={user_id} не найден в группе group_id={group_id}")
-
-            await self.session.execute(
+            result = await self.session.execute(
                 delete(GroupMember)
                 .where(GroupMember.group_id == group_id, GroupMember.user_id == user_id)
+                .returning(GroupMember.id)
             )
-            await self.session.commit()
+            if result.scalar_one_or_none() is None:
+                raise ValueError(f"Участник с user_id={user_id} не найден в группе group_id={group_id}")
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, user_id)
         except IntegrityError as e:
             logger.error(f"Ошибка целостности при удалении участника: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
         except Exception as e:
             logger.error(f"Ошибка при удалении участника: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def ban_user(self, group_id: str, user_id: int):
         try:
-            stmt = select(User).where(User.telegram_id == user_id)
-            result = await self.session.execute(stmt)
-            if not result.scalar_one_or_none():
-                raise ValueError(f"Пользователь с telegram_id={user_id} не найден")
-
-            stmt = select(Group).where(Group.id == group_id)
-            result = await self.session.execute(stmt)
-            if not result.scalar_one_or_none():
-                raise ValueError(f"Группа с ID={group_id} не найдена")
-
-            banned_user = {
-                "group_id": group_id,
-                "user_id": user_id,
-                "banned_at": datetime.utcnow()
-            }
+            # Существование пользователя и группы проверяют внешние ключи banned_users
             await self.session.execute(
                 text(
                     "INSERT INTO banned_users (group_id, user_id, banned_at) "
                     "VALUES (:group_id, :user_id, :banned_at) "
                     "ON CONFLICT (group_id, user_id) DO NOTHING"
                 ),
-                banned_user
+                {"group_id": group_id, "user_id": user_id, "banned_at": datetime.utcnow()}
             )
-            await self.session.commit()
+            await self._commit()
             logger.info(f"Пользователь user_id={user_id} добавлен в бан-лист группы group_id={group_id}")
+        except IntegrityError as e:
+            logger.error(f"Ошибка целостности при добавлении в бан-лист: {e}")
+            await self._rollback()
+            raise ValueError(f"Пользователь user_id={user_id} или группа group_id={group_id} не найдены") from e
         except Exception as e:
             logger.error(f"Ошибка при добавлении в бан-лист: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def unban_user(self, group_id: str, user_id: int):
@@ -427,11 +589,11 @@ class GroupRepo:
                 ),
                 {"group_id": group_id, "user_id": user_id}
             )
-            await self.session.commit()
+            await self._commit()
             logger.info(f"Пользователь user_id={user_id} удалён из бан-листа группы group_id={group_id}")
         except Exception as e:
             logger.error(f"Ошибка при удалении из бан-листа: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def get_banned_users(self, group_id: str):
@@ -459,78 +621,166 @@ class GroupRepo:
             logger.error(f"Ошибка при получении бан-листа: {e}")
             raise
 
-    async def is_user_banned(self, group_id: str, user_id: int) -> bool:
-        try:
-            stmt = text(
-                "SELECT 1 FROM banned_users "
-                "WHERE group_id = :group_id AND user_id = :user_id"
-            )
-            result = await self.session.execute(
-                stmt,
-                {"group_id": group_id, "user_id": user_id}
-            )
-            return result.scalar_one_or_none() is not None
-        except Exception as e:
-            logger.error(f"Ошибка при проверке бан-листа: {e}")
-            raise
-
     async def make_assistant(self, group_id: str, user_id: int):
         try:
-            stmt = (
-                select(GroupMember)
-                .where(GroupMember.group_id == group_id, GroupMember.user_id == user_id)
-            )
-            result = await self.session.execute(stmt)
-            member = result.scalar_one_or_none()
-            if not member:
-                raise ValueError(f"Участник с user_id={user_id} не найден в группе group_id={group_id}")
-
-            await self.session.execute(
+            result = await self.session.execute(
                 update(GroupMember)
                 .where(GroupMember.group_id == group_id, GroupMember.user_id == user_id)
                 .values(is_assistant=True)
+                .returning(GroupMember.id)
             )
-            await self.session.commit()
+            if result.scalar_one_or_none() is None:
+                raise ValueError(f"Участник с user_id={user_id} не найден в группе group_id={group_id}")
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, user_id)
         except IntegrityError as e:
             logger.error(f"Ошибка целостности при назначении помощника: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
         except Exception as e:
             logger.error(f"Ошибка при назначении помощника: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def remove_assistant(self, group_id: str, user_id: int):
         try:
-            stmt = (
-                select(GroupMember)
-                .where(GroupMember.group_id == group_id, GroupMember.user_id == user_id)
-            )
-            result = await self.session.execute(stmt)
-            member = result.scalar_one_or_none()
-            if not member:
-                raise ValueError(f"Участник с user_id={user_id} не найден в группе group_id={group_id}")
-
-            await self.session.execute(
+            result = await self.session.execute(
                 update(GroupMember)
                 .where(GroupMember.group_id == group_id, GroupMember.user_id == user_id)
                 .values(is_assistant=False)
+                .returning(GroupMember.id)
             )
-            await self.session.commit()
+            if result.scalar_one_or_none() is None:
+                raise ValueError(f"Участник с user_id={user_id} не найден в группе group_id={group_id}")
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, user_id)
         except IntegrityError as e:
             logger.error(f"Ошибка целостности при снятии роли помощника: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
         except Exception as e:
             logger.error(f"Ошибка при снятии роли помощника: {e}")
-            await self.session.rollback()
+            await self._rollback()
+            raise
+
+    async def delete_members(self, group_id: str, user_ids: list[int]) -> list[int]:
+        """Исключает сразу нескольких участников одним DELETE; старосту не трогает.
+
+        Возвращает telegram_id действительно исключённых.
+        """
+        try:
+            result = await self.session.execute(
+                delete(GroupMember)
+                .where(
+                    GroupMember.group_id == group_id,
+                    GroupMember.user_id.in_(user_ids),
+                    GroupMember.is_leader == False
+                )
+                .returning(GroupMember.user_id)
+            )
+            removed = list(result.scalars().all())
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, *removed)
+            logger.info(f"Из группы group_id={group_id} исключено участников: {len(removed)}")
+            return removed
+        except Exception as e:
+            logger.error(f"Ошибка при массовом исключении участников: {e}")
+            await self._rollback()
+            raise
+
+    async def ban_users(self, group_id: str, user_ids: list[int]):
+        """Добавляет нескольких пользователей в бан-лист одним INSERT ... SELECT unnest."""
+        try:
+            await self.session.execute(
+                text(
+                    "INSERT INTO banned_users (group_id, user_id, banned_at) "
+                    "SELECT :group_id, unnest(CAST(:user_ids AS BIGINT[])), :banned_at "
+                    "ON CONFLICT (group_id, user_id) DO NOTHING"
+                ),
+                {"group_id": group_id, "user_ids": list(user_ids), "banned_at": datetime.utcnow()}
+            )
+            await self._commit()
+            logger.info(f"В бан-лист группы group_id={group_id} добавлено пользователей: {len(user_ids)}")
+        except IntegrityError as e:
+            logger.error(f"Ошибка целостности при массовом добавлении в бан-лист: {e}")
+            await self._rollback()
+            raise ValueError(f"Группа group_id={group_id} или часть пользователей не найдены") from e
+        except Exception as e:
+            logger.error(f"Ошибка при массовом добавлении в бан-лист: {e}")
+            await self._rollback()
+            raise
+
+    async def set_assistant(self, group_id: str, user_ids: list[int], is_assistant: bool) -> list[int]:
+        """Меняет роль ассистента сразу у нескольких участников одним UPDATE.
+
+        Старосту и участников, у которых роль уже такая, не трогает; возвращает
+        telegram_id тех, чья роль действительно изменилась.
+        """
+        try:
+            result = await self.session.execute(
+                update(GroupMember)
+                .where(
+                    GroupMember.group_id == group_id,
+                    GroupMember.user_id.in_(user_ids),
+                    GroupMember.is_leader == False,
+                    GroupMember.is_assistant != is_assistant
+                )
+                .values(is_assistant=is_assistant)
+                .returning(GroupMember.user_id)
+            )
+            changed = list(result.scalars().all())
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, *changed)
+            return changed
+        except Exception as e:
+            logger.error(f"Ошибка при массовой смене роли ассистента: {e}")
+            await self._rollback()
             raise
 
     async def get_group_members(self, group_id: str):
-        stmt = select(GroupMember).where(GroupMember.group_id == group_id)
+        stmt = (
+            select(GroupMember)
+            .where(GroupMember.group_id == group_id)
+            .order_by(GroupMember.joined_at, GroupMember.user_id)
+        )
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
+    async def get_group_member_rows(self, group_id: str) -> list[dict]:
+        """Возвращает участников группы с ФИО и ролями одним запросом, в порядке нумерации списка."""
+        try:
+            stmt = (
+                select(
+                    GroupMember.user_id,
+                    GroupMember.is_leader,
+                    GroupMember.is_assistant,
+                    User.first_name,
+                    User.last_name,
+                    User.middle_name,
+                    User.telegram_username
+                )
+                .join(User, User.telegram_id == GroupMember.user_id)
+                .where(GroupMember.group_id == group_id)
+                .order_by(GroupMember.joined_at, GroupMember.user_id)
+            )
+            result = await self.session.execute(stmt)
+            return [
+                {
+                    "position": position,
+                    "user_id": row.user_id,
+                    "is_leader": row.is_leader,
+                    "is_assistant": row.is_assistant,
+                    "first_name": row.first_name,
+                    "last_name": row.last_name,
+                    "full_name": format_full_name(row.last_name, row.first_name, row.middle_name),
+                    "telegram_username": row.telegram_username
+                }
+                for position, row in enumerate(result.all(), 1)
+            ]
+        except Exception as e:
+            logger.error(f"Ошибка при получении списка участников группы: {e}")
+            raise
+
     async def get_group_members_except_user(self, group_id: str, exclude_user_id: int):
         try:
             stmt = (
@@ -545,12 +795,31 @@ class GroupRepo:
             logger.error(f"Ошибка при получении участников группы, исключая пользователя: {e}")
             raise
 
-    async def get_group_events(self, group_id: str):
-        stmt = select(Event).where(Event.group_id == group_id).order_by(Event.date)
+    async def get_group_events_in_range(self, group_id: str, start: date, end: date):
+        """События группы с датой в [start, end]; запрос идёт по индексу idx_events_group_id_date."""
+        stmt = (
+            select(Event)
+            .where(Event.group_id == group_id, Event.date.between(start, end))
+            .order_by(Event.date)
+        )
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
-    async def create_event(
+    async def get_week_events(self, group_id: str, week_start: date) -> tuple[CalendarEvent, ...]:
+        """События недели для календаря; при попадании в кэш запрос к базе не выполняется."""
+        events = self.calendar_cache.get(group_id, week_start)
+        if events is not None:
+            return events
+        generation = self.calendar_cache.generation(group_id)
+        rows = await self.get_group_events_in_range(group_id, week_start, week_start + timedelta(days=6))
+        events = tuple(
+            CalendarEvent(id=str(event.id), title=event.title, date=event.date, is_important=event.is_important)
+            for event in rows
+        )
+        self.calendar_cache.put(group_id, week_start, events, generation)
+        return events
+
+    async def _add_event(
         self,
         group_id: str,
         created_by_user_id: int,
@@ -560,68 +829,94 @@ class GroupRepo:
         date: datetime.date = None,
         is_important: bool = False
     ) -> Event:
+        """Добавляет событие и уведомления о нём в текущую транзакцию, не коммитя её."""
+        group = await self.get_group_by_id(group_id)
+        if not group:
+            raise ValueError(f"Группа с ID={group_id} не найдена")
+
+        event_date = date
+        if isinstance(date, str):
+            try:
+                event_date = datetime.strptime(date, '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError("Неверный формат даты. Используйте YYYY-MM-DD.")
+
+        event = Event(
+            group_id=group_id,
+            created_by_user_id=created_by_user_id,
+            title=title,
+            description=description,
+            subject=subject,
+            date=event_date,
+            is_important=is_important
+        )
+        self.session.add(event)
+        await self.session.flush()
+
+        # Уведомления участникам пишутся в outbox в той же транзакции, что и событие
+        members = await self.get_group_members_except_user(group_id, created_by_user_id)
+        notification_text = (
+            f"Новое событие в группе «{group.name}»:\n"
+            f"Название: {title}\n"
+            f"Дата: {event_date.strftime('%d.%m.%Y')}\n"
+        )
+        if description:
+            notification_text += f"Описание: {description}\n"
+        if subject:
+            notification_text += f"Предмет: {subject}\n"
+        if is_important:
+            notification_text += "⚠️ [Важное]"
+
+        await self.enqueue_notifications(
+            [member.user_id for member in members],
+            notification_text,
+            idempotency_key=f"event_created:{event.id}"
+        )
+        return event
+
+    async def create_event_bundle(
+        self,
+        group_id: str,
+        created_by_user_id: int,
+        title: str,
+        description: str = None,
+        subject: str = None,
+        date: datetime.date = None,
+        is_important: bool = False,
+        queue_slots: int | None = None,
+        topics: list[dict] | None = None,
+        max_participants_per_topic: int = 1
+    ) -> Event:
+        """Создаёт событие вместе с очередью и списком тем в одной транзакции.
+
+        Список тем с темами вставляется одним запросом. Всё фиксируется одним
+        коммитом: при ошибке не остаётся события без очереди или тем, а
+        уведомления из outbox уходят только после коммита.
+        """
         try:
-            group = await self.get_group_by_id(group_id)
-            if not group:
-                raise ValueError(f"Группа с ID={group_id} не найдена")
+            event = await self._add_event(group_id, created_by_user_id, title, description, subject, date, is_important)
 
-            user_stmt = select(User).where(User.telegram_id == created_by_user_id)
-            user_result = await self.session.execute(user_stmt)
-            if not user_result.scalar_one_or_none():
-                raise ValueError(f"Пользователь с telegram_id={created_by_user_id} не найден")
+            if queue_slots:
+                await self.session.execute(
+                    insert(Queue).values(event_id=event.id, title=title, max_participants=queue_slots)
+                )
 
-            event_date = date
-            if isinstance(date, str):
-                try:
-                    event_date = datetime.strptime(date, '%Y-%m-%d').date()
-                except ValueError:
-                    raise ValueError("Неверный формат даты. Используйте YYYY-MM-DD.")
+            if topics:
+                await self._add_topic_list(event.id, created_by_user_id, topics, max_participants_per_topic)
 
-            event = Event(
-                group_id=group_id,
-                created_by_user_id=created_by_user_id,
-                title=title,
-                description=description,
-                subject=subject,
-                date=event_date,
-                is_important=is_important
+            await self._commit()
+            self._after_commit(self.calendar_cache.invalidate, group_id, event.date)
+            logger.info(
+                f"Событие event_id={event.id} создано: очередь={queue_slots or 0} мест, тем={len(topics or [])}"
             )
-            self.session.add(event)
-            await self.session.commit()
-            await self.session.refresh(event)
-
-            # Уведомляем всех участников группы, кроме создателя
-            members = await self.get_group_members_except_user(group_id, created_by_user_id)
-            notification_text = (
-                f"Новое событие в группе «{group.name}»:\n"
-                f"Название: {title}\n"
-                f"Дата: {event_date.strftime('%d.%m.%Y')}\n"
-            )
-            if description:
-                notification_text += f"Описание: {description}\n"
-            if subject:
-                notification_text += f"Предмет: {subject}\n"
-            if is_important:
-                notification_text += "⚠️ [Важное]"
-
-            for member in members:
-                try:
-                    await self.bot.send_message(
-                        chat_id=member.user_id,
-                        text=notification_text
-                    )
-                    logger.info(f"Уведомление отправлено пользователю user_id={member.user_id} о событии event_id={event.id}")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке уведомления пользователю user_id={member.user_id}: {e}")
-
             return event
         except IntegrityError as e:
-            logger.error(f"Ошибка целостности при создании события: {e}")
-            await self.session.rollback()
+            logger.error(f"Ошибка целостности при создании события с очередью и темами: {e}")
+            await self._rollback()
             raise
         except Exception as e:
-            logger.error(f"Ошибка при создании события: {e}")
-            await self.session.rollback()
+            logger.error(f"Ошибка при создании события с очередью и темами: {e}")
+            await self._rollback()
             raise
 
     async def get_event_by_id(self, event_id: str) -> Event | None:
@@ -629,20 +924,67 @@ class GroupRepo:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
-    async def create_topic_list(self, topic_list: TopicList):
+    async def _add_topic_list(
+        self,
+        event_id: str,
+        created_by_user_id: int,
+        topics: list[dict],
+        max_participants_per_topic: int = 1,
+        title: str = "Список тем"
+    ) -> uuid.UUID:
+        """Добавляет список тем со всеми темами одним запросом, не коммитя транзакцию.
+
+        Список вставляется в CTE, а темы — INSERT ... SELECT из VALUES, поэтому
+        50 тем — это один запрос к базе, а не 51 INSERT при flush.
+        """
+        topic_list_id = uuid.uuid4()
+        new_list = (
+            insert(TopicList)
+            .values(
+                id=topic_list_id,
+                event_id=event_id,
+                title=title,
+                max_participants_per_topic=max_participants_per_topic,
+                created_by_user_id=created_by_user_id
+            )
+            .returning(TopicList.id)
+            .cte("new_list")
+        )
+        new_topics = values(
+            column("title", String), column("description", String), name="new_topics"
+        ).data([(topic["title"], topic.get("description")) for topic in topics])
+        await self.session.execute(
+            insert(Topic)
+            .from_select(
+                ["topic_list_id", "title", "description"],
+                select(new_list.c.id, new_topics.c.title, new_topics.c.description)
+            )
+            .add_cte(new_list)
+        )
+        return topic_list_id
+
+    async def create_topic_list(
+        self,
+        event_id: str,
+        created_by_user_id: int,
+        topics: list[dict],
+        max_participants_per_topic: int = 1,
+        title: str = "Список тем"
+    ) -> uuid.UUID:
         try:
-            self.session.add(topic_list)
-            for topic in topic_list.topics:
-                self.session.add(topic)
-            await self.session.commit()
-            logger.info(f"Список тем создан: id={topic_list.id}, event_id={topic_list.event_id}")
+            if not topics:
+                raise ValueError("Список тем пуст")
+            topic_list_id = await self._add_topic_list(event_id, created_by_user_id, topics, max_participants_per_topic, title)
+            await self._commit()
+            logger.info(f"Список тем создан: id={topic_list_id}, event_id={event_id}, тем={len(topics)}")
+            return topic_list_id
         except IntegrityError as e:
             logger.error(f"Ошибка целостности при создании списка тем: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
         except Exception as e:
             logger.error(f"Ошибка при создании списка тем: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
     async def create_invite(self, group_id: str, invited_by_user_id: int) -> str:
@@ -656,35 +998,96 @@ class GroupRepo:
                 expires_at=datetime(2100, 1, 1).date()
             )
             self.session.add(invite)
-            await self.session.commit()
+            await self._commit()
             return invite_token
         except IntegrityError as e:
             logger.error(f"Ошибка целостности при создании ключа доступа: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
         except Exception as e:
             logger.error(f"Ошибка при создании ключа доступа: {e}")
-            await self.session.rollback()
+            await self._rollback()
             raise
 
-    async def get_group_by_invite(self, invite_token: str) -> Group | None:
-        logger.info(f"Попытка получить группу по ключу доступа: {invite_token}")
-        stmt = (
-            select(Group)
-            .join(Invite)
-            .where(
-                Invite.invite_token == invite_token,
-                Invite.expires_at >= datetime.now().date()
+    async def join_group_by_invite(
+        self,
+        invite_token: str,
+        telegram_id: int,
+        username: str | None,
+        first_name: str | None,
+        last_name: str | None
+    ) -> dict:
+        """Вступление в группу по ключу одним запросом.
+
+        CTE проверяет ключ и срок действия, бан-лист группы, при необходимости
+        создаёт пользователя и добавляет членство (ON CONFLICT по user_id:
+        пользователь может состоять только в одной группе). Возвращает словарь
+        со статусом invalid / banned / already_in_group / already_member / joined
+        и данными группы; already_in_group — пользователь уже состоит в этой же группе.
+        """
+        try:
+            result = await self.session.execute(
+                text(
+                    "WITH invite AS ("
+                    "    SELECT g.id AS group_id, g.name AS group_name"
+                    "    FROM groupinvitations i JOIN groups g ON g.id = i.group_id"
+                    "    WHERE i.invite_token = :token AND i.expires_at >= CURRENT_DATE"
+                    "), banned AS ("
+                    "    SELECT 1 FROM banned_users b JOIN invite ON b.group_id = invite.group_id"
+                    "    WHERE b.user_id = :user_id"
+                    "), new_user AS ("
+                    "    INSERT INTO users (telegram_id, telegram_username, first_name, last_name, notification_settings)"
+                    "    SELECT :user_id, :username, :first_name, :last_name, '{}'::jsonb"
+                    "    WHERE EXISTS (SELECT 1 FROM invite) AND NOT EXISTS (SELECT 1 FROM banned)"
+                    "    ON CONFLICT (telegram_id) DO NOTHING"
+                    "    RETURNING telegram_id"
+                    "), membership AS ("
+                    "    INSERT INTO groupmembers (user_id, group_id, is_leader, is_assistant)"
+                    "    SELECT :user_id, invite.group_id, false, false FROM invite"
+                    "    WHERE NOT EXISTS (SELECT 1 FROM banned)"
+                    "    ON CONFLICT (user_id) DO NOTHING"
+                    "    RETURNING group_id"
+                    ") "
+                    "SELECT invite.group_id, invite.group_name,"
+                    "    EXISTS (SELECT 1 FROM banned) AS is_banned,"
+                    "    EXISTS (SELECT 1 FROM membership) AS joined,"
+                    "    EXISTS ("
+                    "        SELECT 1 FROM groupmembers m"
+                    "        WHERE m.user_id = :user_id AND m.group_id = invite.group_id"
+                    "    ) AS same_group "
+                    "FROM invite"
+                ),
+                {
+                    "token": invite_token,
+                    "user_id": telegram_id,
+                    "username": username,
+                    "first_name": first_name or "Неизвестно",
+                    "last_name": last_name
+                }
             )
-        )
-        result = await self.session.execute(stmt)
-        group = result.scalar_one_or_none()
-        if group:
-            logger.info(f"Группа найдена: {group.name}, ID: {group.id}")
-        else:
-            logger.info("Группа не найдена или ключ недействителен")
-        return group
-    
+            row = result.first()
+            if row is None:
+                logger.info(f"Ключ доступа недействителен: user_id={telegram_id}")
+                return {"status": "invalid"}
+            if row.is_banned:
+                status = "banned"
+            elif row.joined:
+                status = "joined"
+            elif row.same_group:
+                # Основной запрос видит членство до вставки в CTE, то есть только уже существовавшее
+                status = "already_in_group"
+            else:
+                status = "already_member"
+            await self._commit()
+            if status == "joined":
+                self._after_commit(self.user_cache.invalidate, telegram_id)
+            logger.info(f"Вступление по ключу: user_id={telegram_id}, group_id={row.group_id}, статус={status}")
+            return {"status": status, "group_id": str(row.group_id), "group_name": row.group_name}
+        except Exception as e:
+            logger.error(f"Ошибка при вступлении в группу по ключу: {e}")
+            await self._rollback()
+            raise
+
     async def leave_group(self, group_id: str, user_id: int) -> bool:
         try:
             stmt = (
@@ -702,12 +1105,13 @@ class GroupRepo:
                 return False
 
             await self.session.delete(member)
-            await self.session.commit()
+            await self._commit()
+            self._after_commit(self.user_cache.invalidate, user_id)
             logger.info(f"Участник user_id={user_id} успешно покинул группу group_id={group_id}")
             return True
         except Exception as e:
             logger.error(f"Ошибка при выходе из группы: {e}")
-            await self.session.rollback()
+            await self._rollback()
             return False
 
     async def delete_group(self, group_id: str, leader_id: int) -> bool:
@@ -734,52 +1138,82 @@ class GroupRepo:
                 return False
 
             await self.session.delete(group)
-            await self.session.commit()
+            await self._commit()
+            self._after_commit(self.calendar_cache.invalidate_group, group_id)
+            self._after_commit(self.user_cache.invalidate_group, group_id)
             logger.info(f"Группа group_id={group_id} успешно удалена лидером user_id={leader_id}")
             return True
         except Exception as e:
             logger.error(f"Ошибка при удалении группы: {e}")
-            await self.session.rollback()
+            if self.in_transaction:
+                # Внутри transaction() ошибка должна откатить всю транзакцию, а не только удаление
+                raise
+            await self._rollback()
             return False
     
+    async def _strip_legacy_queue_keys(self, event_ids: list, group_ids: set):
+        """Одним UPDATE убирает ключи старых JSON-очередей этих событий у участников их групп."""
+        keys = [str(event_id) for event_id in event_ids]
+        await self.session.execute(
+            update(User)
+            .where(
+                User.telegram_id.in_(select(GroupMember.user_id).where(GroupMember.group_id.in_(group_ids))),
+                User.notification_settings.has_any(cast(keys, ARRAY(Text)))
+            )
+            # last_active_at не трогаем: это служебная очистка, а не активность пользователя
+            .values(
+                notification_settings=User.notification_settings.op("-")(cast(keys, ARRAY(Text))),
+                last_active_at=User.last_active_at
+            )
+        )
+
     async def delete_event(self, event_id: str):
+        """Удаляет событие; очередь, участники очереди и темы удаляются каскадом."""
         try:
-            # Проверяем существование события
-            stmt = select(Event).where(Event.id == event_id)
-            result = await self.session.execute(stmt)
-            event = result.scalar_one_or_none()
-            if not event:
+            result = await self.session.execute(
+                delete(Event).where(Event.id == event_id).returning(Event.group_id, Event.date)
+            )
+            deleted = result.first()
+            if not deleted:
                 logger.error(f"Событие с event_id={event_id} не найдено")
                 raise ValueError(f"Событие с ID={event_id} не найдено")
 
-            # Удаляем событие из таблицы events
-            await self.session.execute(
-                delete(Event).where(Event.id == event_id)
-            )
-
-            # Находим всех участников группы
-            stmt = select(GroupMember).where(GroupMember.group_id == event.group_id)
-            result = await self.session.execute(stmt)
-            members = result.scalars().all()
-
-            # Удаляем данные об очереди из notification_settings
-            for member in members:
-                stmt = select(User).where(User.telegram_id == member.user_id)
-                result = await self.session.execute(stmt)
-                user = result.scalar_one_or_none()
-                if user and user.notification_settings and str(event_id) in user.notification_settings:
-                    notification_settings = user.notification_settings.copy()
-                    del notification_settings[str(event_id)]
-                    await self.session.execute(
-                        update(User)
-                        .where(User.telegram_id == user.telegram_id)
-                        .values(notification_settings=notification_settings)
-                    )
-
-            # Фиксируем изменения
-            await self.session.commit()
+            await self._strip_legacy_queue_keys([event_id], {deleted.group_id})
+            await self._commit()
+            self._after_commit(self.calendar_cache.invalidate, deleted.group_id, deleted.date)
             logger.info(f"Событие event_id={event_id} успешно удалено вместе с очередью")
         except Exception as e:
             logger.error(f"Ошибка при удалении события {event_id}: {e}", exc_info=True)
-            await self.session.rollback()
-            raise
\ No newline at end of file
+            await self._rollback()
+            raise
+
+    async def purge_events_before(self, cutoff: date, chunk_size: int = 1000) -> int:
+        """Удаляет одну порцию событий с датой раньше cutoff и возвращает их число.
+
+        Порция ограничена chunk_size и выбирается с SKIP LOCKED, поэтому
+        транзакция короткая и не мешает обработчикам, работающим с теми же событиями.
+        """
+        try:
+            batch = (
+                select(Event.id)
+                .where(Event.date < cutoff)
+                .order_by(Event.date)
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True)
+            )
+            result = await self.session.execute(
+                delete(Event)
+                .where(Event.id.in_(batch.scalar_subquery()))
+                .returning(Event.id, Event.group_id, Event.date)
+            )
+            deleted = result.all()
+            if deleted:
+                await self._strip_legacy_queue_keys([row.id for row in deleted], {row.group_id for row in deleted})
+            await self._commit()
+            for row in deleted:
+                self._after_commit(self.calendar_cache.invalidate, row.group_id, row.date)
+            return len(deleted)
+        except Exception as e:
+            logger.error(f"Ошибка при очистке старых событий: {e}", exc_info=True)
+            await self._rollback()
+            raise
@@ -4,8 +4,10 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from datetime import datetime, timedelta
+from app.db.context import CurrentUser
 from app.db.repository import UserRepo, GroupRepo
 from app.keyboards.reply import get_event_details_keyboard
+from app.services.ui_flags import UiFlags
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -107,17 +109,16 @@ def get_month_selection_keyboard(current_year):
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 @router.message(F.text == "📅 Показать календарь")
-async def show_calendar(message: Message, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def show_calendar(message: Message, group_repo: GroupRepo, state: FSMContext, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await message.answer("Вы не состоите в группе.")
             return
 
         group = user.group_membership.group
         start_of_week, end_of_week = get_week_dates()
-        events = await group_repo.get_group_events(group.id)
-        week_events = [event for event in events if start_of_week <= event.date <= end_of_week]
+        week_events = await group_repo.get_week_events(group.id, start_of_week)
         
         start_day = start_of_week.strftime("%d").lstrip("0")
         start_month = MONTHS_RU[start_of_week.month]
@@ -134,10 +135,10 @@ async def show_calendar(message: Message, user_repo: UserRepo, group_repo: Group
         await message.answer("Произошла ошибка. Попробуйте позже.")
 
 @router.callback_query(F.data.startswith("week_"))
-async def handle_week_selection(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def handle_week_selection(callback: CallbackQuery, group_repo: GroupRepo, state: FSMContext, current_user: CurrentUser | None):
     try:
         offset = int(callback.data.split("_")[1])
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -145,8 +146,7 @@ async def handle_week_selection(callback: CallbackQuery, user_repo: UserRepo, gr
 
         group = user.group_membership.group
         start_of_week, end_of_week = get_week_dates(offset)
-        events = await group_repo.get_group_events(group.id)
-        week_events = [event for event in events if start_of_week <= event.date <= end_of_week]
+        week_events = await group_repo.get_week_events(group.id, start_of_week)
         
         start_day = start_of_week.strftime("%d").lstrip("0")
         start_month = MONTHS_RU[start_of_week.month]
@@ -164,11 +164,11 @@ async def handle_week_selection(callback: CallbackQuery, user_repo: UserRepo, gr
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data == "select_week")
-async def start_select_week(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def start_select_week(callback: CallbackQuery, group_repo: GroupRepo, state: FSMContext, current_user: CurrentUser | None):
     try:
         data = await state.get_data()
         week_offset = data.get("week_offset", 0)
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -220,7 +220,7 @@ async def handle_year_shift(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data.startswith("month_"))
-async def handle_month_selection(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def handle_month_selection(callback: CallbackQuery, group_repo: GroupRepo, state: FSMContext, current_user: CurrentUser | None):
     try:
         month = int(callback.data.split("_")[1])
         data = await state.get_data()
@@ -232,7 +232,7 @@ async def handle_month_selection(callback: CallbackQuery, user_repo: UserRepo, g
         current_week_start = today - timedelta(days=today.weekday())
         offset = (week_start - current_week_start).days // 7
 
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -240,8 +240,7 @@ async def handle_month_selection(callback: CallbackQuery, user_repo: UserRepo, g
 
         group = user.group_membership.group
         start_of_week, end_of_week = get_week_dates(offset)
-        events = await group_repo.get_group_events(group.id)
-        week_events = [event for event in events if start_of_week <= event.date <= end_of_week]
+        week_events = await group_repo.get_week_events(group.id, start_of_week)
         
         start_day = start_of_week.strftime("%d").lstrip("0")
         start_month = MONTHS_RU[start_of_week.month]
@@ -259,10 +258,10 @@ async def handle_month_selection(callback: CallbackQuery, user_repo: UserRepo, g
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data.startswith("shift_weeks_"))
-async def handle_shift_weeks(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def handle_shift_weeks(callback: CallbackQuery, group_repo: GroupRepo, state: FSMContext, current_user: CurrentUser | None):
     try:
         new_offset = int(callback.data.split("_")[2])
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -282,7 +281,7 @@ async def handle_shift_weeks(callback: CallbackQuery, user_repo: UserRepo, group
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data.startswith("event_"))
-async def handle_event_details(callback: CallbackQuery, group_repo: GroupRepo, user_repo: UserRepo, state: FSMContext):
+async def handle_event_details(callback: CallbackQuery, group_repo: GroupRepo, user_repo: UserRepo, ui_flags: UiFlags, current_user: CurrentUser | None):
     try:
         event_id = callback.data.replace("event_", "")
         event = await group_repo.get_event_by_id(event_id)
@@ -291,7 +290,7 @@ async def handle_event_details(callback: CallbackQuery, group_repo: GroupRepo, u
             await callback.answer()
             return
 
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -306,8 +305,7 @@ async def handle_event_details(callback: CallbackQuery, group_repo: GroupRepo, u
                     is_in_queue = True
                     break
 
-        data = await state.get_data()
-        show_view_queue = data.get(f"show_view_queue_{event_id}", True)
+        show_view_queue = not await ui_flags.get(callback.from_user.id, f"view_queue_hidden_{event_id}", False)
 
         # Проверяем, является ли пользователь старостой или ассистентом
         can_delete = user.group_membership.is_leader or user.group_membership.is_assistant
@@ -336,10 +334,10 @@ async def handle_event_details(callback: CallbackQuery, group_repo: GroupRepo, u
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data.startswith("join_queue_"))
-async def join_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def join_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, ui_flags: UiFlags, current_user: CurrentUser | None):
     try:
         event_id = callback.data.replace("join_queue_", "")
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -355,8 +353,7 @@ async def join_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: G
         queue_data = await user_repo.get_queue_entries(event_id)
         has_queue = bool(queue_data and "max_slots" in queue_data)
 
-        data = await state.get_data()
-        show_view_queue = data.get(f"show_view_queue_{event_id}", True)
+        show_view_queue = not await ui_flags.get(callback.from_user.id, f"view_queue_hidden_{event_id}", False)
 
         # Проверяем, является ли пользователь старостой или ассистентом
         can_delete = user.group_membership.is_leader or user.group_membership.is_assistant
@@ -385,10 +382,10 @@ async def join_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: G
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data.startswith("leave_queue_"))
-async def leave_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def leave_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, ui_flags: UiFlags, current_user: CurrentUser | None):
     try:
         event_id = callback.data.replace("leave_queue_", "")
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -405,8 +402,8 @@ async def leave_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo:
         has_queue = bool(queue_data and "max_slots" in queue_data)
         is_in_queue = False
 
-        # Сбрасываем состояние show_view_queue для данного события
-        await state.update_data(**{f"show_view_queue_{event_id}": True})
+        # Снова показываем кнопку просмотра очереди для данного события
+        await ui_flags.reset(callback.from_user.id, f"view_queue_hidden_{event_id}")
         show_view_queue = True
 
         # Проверяем, является ли пользователь старостой или ассистентом
@@ -436,7 +433,7 @@ async def leave_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo:
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data.startswith("view_queue_"))
-async def view_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def view_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, ui_flags: UiFlags, current_user: CurrentUser | None):
     try:
         event_id = callback.data.replace("view_queue_", "")
         event = await group_repo.get_event_by_id(event_id)
@@ -445,14 +442,14 @@ async def view_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: G
             await callback.answer()
             return
 
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership or str(user.group_membership.group.id) != str(event.group_id):
             await callback.message.edit_text("У вас нет доступа к этой очереди.")
             await callback.answer()
             return
 
-        queue_data = await user_repo.get_queue_entries(event_id)
-        if not queue_data or "entries" not in queue_data:
+        queue_data = await user_repo.get_queue_rows(event_id)
+        if not queue_data:
             await callback.message.edit_text("Очередь для этого события не создана.")
             await callback.answer()
             return
@@ -461,28 +458,18 @@ async def view_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: G
         max_slots = queue_data["max_slots"]
         response = f"Очередь для события «{event.title}» ({len(entries)}/{max_slots} мест занято):\n"
 
-        sorted_entries = sorted(entries.items(), key=lambda x: int(x[0]))
-        for position, user_id in sorted_entries:
-            user_info = await user_repo.get_user_with_group_info(int(user_id))
-            if user_info:
-                full_name = f"{user_info.last_name or ''} {user_info.first_name} {user_info.middle_name or ''}".strip()
-                response += f"{position}. {full_name} (@{user_info.telegram_username or 'без имени'})\n"
-            else:
-                response += f"{position}. Неизвестный пользователь (ID: {user_id})\n"
+        for entry in entries:
+            response += f"{entry['position']}. {entry['full_name']} (@{entry['telegram_username'] or 'без имени'})\n"
 
         if not entries:
             response += "Очередь пуста."
 
-        is_in_queue = False
-        for position, queued_user_id in entries.items():
-            if int(queued_user_id) == callback.from_user.id:
-                is_in_queue = True
-                break
+        is_in_queue = any(entry["user_id"] == callback.from_user.id for entry in entries)
 
         # Проверяем, является ли пользователь старостой или ассистентом
         can_delete = user.group_membership.is_leader or user.group_membership.is_assistant
 
-        await state.update_data(**{f"show_view_queue_{event_id}": False})
+        await ui_flags.set(callback.from_user.id, f"view_queue_hidden_{event_id}", True)
         await callback.message.edit_text(
             response,
             reply_markup=get_event_details_keyboard(event_id, True, is_in_queue, show_view_queue=False, can_delete=can_delete)
@@ -494,7 +481,7 @@ async def view_queue(callback: CallbackQuery, user_repo: UserRepo, group_repo: G
         await callback.answer("Произошла ошибка.", show_alert=True)
 
 @router.callback_query(F.data.startswith("delete_event_"))
-async def delete_event(callback: CallbackQuery, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def delete_event(callback: CallbackQuery, group_repo: GroupRepo, state: FSMContext, current_user: CurrentUser | None):
     try:
         event_id = callback.data.replace("delete_event_", "")
         event = await group_repo.get_event_by_id(event_id)
@@ -503,7 +490,7 @@ async def delete_event(callback: CallbackQuery, user_repo: UserRepo, group_repo:
             await callback.answer()
             return
 
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await callback.answer()
@@ -523,8 +510,7 @@ async def delete_event(callback: CallbackQuery, user_repo: UserRepo, group_repo:
         week_offset = data.get("week_offset", 0)
         group = user.group_membership.group
         start_of_week, end_of_week = get_week_dates(week_offset)
-        events = await group_repo.get_group_events(group.id)
-        week_events = [event for event in events if start_of_week <= event.date <= end_of_week]
+        week_events = await group_repo.get_week_events(group.id, start_of_week)
         
         start_day = start_of_week.strftime("%d").lstrip("0")
         start_month = MONTHS_RU[start_of_week.month]
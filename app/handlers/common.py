@@ -6,6 +6,7 @@ from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from app.db.context import CurrentUser
 from app.db.repository import UserRepo, GroupRepo
 from app.keyboards.reply import get_main_menu_unregistered, get_main_menu_leader, get_regular_member_menu, get_assistant_menu, get_skip_keyboard
 
@@ -191,9 +192,9 @@ async def process_middle_name(message: Message, state: FSMContext, user_repo: Us
         await message.answer("Произошла ошибка. Попробуйте позже.")
 
 @router.message(F.text == "🚀 Создать группу")
-async def start_create_group(message: Message, state: FSMContext, user_repo: UserRepo):
+async def start_create_group(message: Message, state: FSMContext, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if user.group_membership:
             await message.answer("Вы уже состоите в группе. Нельзя создать еще одну.")
             return
@@ -230,9 +231,9 @@ async def process_group_name(message: Message, state: FSMContext, group_repo: Gr
         await message.answer("Произошла ошибка при создании группы. Попробуйте позже.")
 
 @router.message(F.text == "🔗 Присоединиться по ключу")
-async def start_join_group(message: Message, state: FSMContext, user_repo: UserRepo):
+async def start_join_group(message: Message, state: FSMContext, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if user.group_membership:
             await message.answer("Вы уже состоите в группе. Нельзя присоединиться к другой.")
             return
@@ -260,7 +261,7 @@ async def cancel_join_group(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer("Произошла ошибка при отмене. Попробуйте позже.")
 
 @router.message(JoinGroup.waiting_for_invite_token)
-async def process_invite_link(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def process_invite_link(message: Message, state: FSMContext, group_repo: GroupRepo):
     try:
         access_key = message.text.strip()
         match = re.match(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$', access_key)
@@ -268,29 +269,33 @@ async def process_invite_link(message: Message, state: FSMContext, user_repo: Us
             await message.answer("Неверный формат ключа доступа. Используйте ключ вида xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx.")
             return
 
-        group = await group_repo.get_group_by_invite(access_key)
-        if not group:
+        # Проверка ключа, бан-листа, создание пользователя и членства — одним запросом
+        joined = await group_repo.join_group_by_invite(
+            invite_token=access_key,
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        if joined["status"] == "invalid":
             await message.answer("Ключ доступа недействителен.")
             return
-
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
-        if not user:
-            user = await user_repo.get_or_create_user(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name or "Неизвестно",
-                last_name=message.from_user.last_name or None
-            )
-
-        if await group_repo.is_user_banned(group.id, user.telegram_id):
+        if joined["status"] == "banned":
             await message.answer("Вы не можете зайти, так как вас заблокировали.")
             await state.clear()
             return
+        if joined["status"] == "already_in_group":
+            await message.answer(f"Вы уже состоите в группе «{joined['group_name']}».")
+            await state.clear()
+            return
+        if joined["status"] == "already_member":
+            await message.answer("Вы уже состоите в группе. Нельзя присоединиться к другой.")
+            await state.clear()
+            return
 
-        await group_repo.add_member(group_id=group.id, user_id=user.telegram_id, is_leader=False)
         await state.clear()
         await message.answer(
-            f"Вы успешно присоединились к группе «{group.name}»!",
+            f"Вы успешно присоединились к группе «{joined['group_name']}»!",
             reply_markup=get_regular_member_menu()
         )
     except Exception as e:
@@ -5,11 +5,10 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from app.db.repository import UserRepo, GroupRepo
+from app.db.context import CurrentUser
+from app.db.repository import GroupRepo
 from datetime import datetime, timedelta
 from app.keyboards.reply import get_assistant_menu, get_main_menu_leader, get_main_menu_unregistered
-from uuid import uuid4
-from app.db.models import TopicList, Topic
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -145,10 +144,10 @@ def get_topics_and_queues_keyboard(topics_count: int) -> InlineKeyboardBuilder:
     return keyboard
 
 @router.message(F.text == "➕ Создать событие")
-async def start_create_event(message: Message, state: FSMContext, user_repo: UserRepo):
+async def start_create_event(message: Message, state: FSMContext, current_user: CurrentUser | None):
     """Запускает процесс создания события."""
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         logger.info(f"User check for event creation: {user}, membership: {user.group_membership if user else None}")
         if not user or not user.group_membership or not (user.group_membership.is_leader or user.group_membership.is_assistant):
             await message.answer("У вас нет прав для создания событий.")
@@ -173,10 +172,10 @@ async def start_create_event(message: Message, state: FSMContext, user_repo: Use
         await message.answer("Произошла ошибка. Попробуйте позже.")
 
 @router.callback_query(F.data == "cancel_event_creation")
-async def cancel_event_creation(callback: CallbackQuery, state: FSMContext, user_repo: UserRepo):
+async def cancel_event_creation(callback: CallbackQuery, state: FSMContext, current_user: CurrentUser | None):
     """Отменяет создание события."""
     try:
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.answer("Вы не состоите в группе.")
             await state.clear()
@@ -511,7 +510,7 @@ async def process_queue_slots(message: Message, state: FSMContext):
         await message.answer("Произошла ошибка. Попробуйте позже.")
         
 @router.callback_query(F.data == "finish_event_creation")
-async def finish_event_creation(callback: CallbackQuery, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def finish_event_creation(callback: CallbackQuery, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     """Завершает создание события."""
     try:
         data = await state.get_data()
@@ -551,7 +550,7 @@ async def finish_event_creation(callback: CallbackQuery, state: FSMContext, user
             return
 
         # Получение информации о пользователе и группе
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await callback.message.edit_text("Вы не состоите в группе.")
             await state.clear()
@@ -568,39 +567,22 @@ async def finish_event_creation(callback: CallbackQuery, state: FSMContext, user
         queue_slots = data.get("queue_slots")
         topic_list_data = data.get("topic_list_data", {"topics": [], "max_participants_per_topic": 1})
 
-        # Создание события
-        event = await group_repo.create_event(
+        max_participants = topic_list_data.get("max_participants_per_topic", 1)
+
+        # Событие, очередь и темы создаются одной транзакцией
+        event = await group_repo.create_event_bundle(
             group_id=group_id,
             created_by_user_id=created_by_user_id,
             title=title,
             description=description,
             subject=subject,
             date=date_str,
-            is_important=is_important
+            is_important=is_important,
+            queue_slots=queue_slots,
+            topics=topic_list_data["topics"],
+            max_participants_per_topic=max_participants
         )
 
-        # Создание очереди, если указаны слоты
-        if queue_slots:
-            await user_repo.create_queue(event_id=str(event.id), max_slots=queue_slots)
-
-        # Создание списка тем, если есть темы
-        if topic_list_data["topics"]:
-            topic_list_id = str(uuid4())
-            topics = [
-                Topic(id=str(uuid4()), topic_list_id=topic_list_id, title=topic["title"], description=topic["description"])
-                for topic in topic_list_data["topics"]
-            ]
-            max_participants = topic_list_data.get("max_participants_per_topic", 1)
-            topic_list = TopicList(
-                id=topic_list_id,
-                event_id=str(event.id),
-                title="Список тем",
-                max_participants_per_topic=max_participants,
-                created_by_user_id=created_by_user_id,
-                topics=topics
-            )
-            await group_repo.create_topic_list(topic_list)
-
         if event:
             # Успешное создание
             reply_markup = get_main_menu_leader() if user.group_membership.is_leader else get_assistant_menu()
@@ -1,10 +1,12 @@
 import logging
-from aiogram import Router, F, Bot
+import re
+from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from app.db.repository import GroupRepo, UserRepo
+from app.db.context import CurrentUser
+from app.db.repository import GroupRepo
 from app.keyboards.reply import get_main_menu_leader, get_assistant_menu, get_regular_member_menu, get_main_menu_unregistered
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from aiogram.exceptions import TelegramNetworkError
@@ -28,6 +30,30 @@ class RemoveAssistant(StatesGroup):
 class BanList(StatesGroup):
     waiting_for_unban_number = State()
 
+def parse_member_numbers(text: str, max_number: int) -> list[int]:
+    """Разбирает список номеров вида «3,5,7-12» в отсортированные номера без повторов.
+
+    Бросает ValueError, если формат неверный или номер вне диапазона 1..max_number.
+    """
+    numbers = set()
+    for part in re.split(r"[,\s]+", text.strip()):
+        if not part:
+            continue
+        if "-" in part:
+            start, _, end = part.partition("-")
+            first, last = int(start), int(end)
+        else:
+            first = last = int(part)
+        if first > last or first < 1 or last > max_number:
+            raise ValueError(f"Неверный номер или диапазон: {part}, допустимо 1..{max_number}")
+        numbers.update(range(first, last + 1))
+    if not numbers:
+        raise ValueError("Номера не указаны")
+    return sorted(numbers)
+
+def format_member_names(members: list[dict]) -> str:
+    return ", ".join(f"{member['first_name']} {member['last_name'] or ''}".strip() for member in members)
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=1, max=10),
@@ -40,27 +66,24 @@ async def send_message_with_retry(message: Message, text: str, reply_markup=None
     await message.answer(text, reply_markup=reply_markup)
 
 @router.message(F.text == "👥 Участники группы*")
-async def handle_group_members(message: Message, user_repo: UserRepo, group_repo: GroupRepo, state: FSMContext):
+async def handle_group_members(message: Message, group_repo: GroupRepo, state: FSMContext, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if not user or not user.group_membership or not user.group_membership.is_leader:
             await message.answer("У вас нет прав для просмотра участников группы.")
             return
 
         group = user.group_membership.group
-        members = await group_repo.get_group_members(group.id)
+        members = await group_repo.get_group_member_rows(group.id)
         if not members:
             await message.answer("В группе пока нет участников.")
             return
 
         member_list = []
-        for idx, member in enumerate(members, 1):
-            member_user = await user_repo.get_user_with_group_info(member.user_id)
-            if member_user:
-                role = "Староста" if member.is_leader else "Ассистент" if member.is_assistant else "Участник"
-                full_name = f"{member_user.last_name or ''} {member_user.first_name} {member_user.middle_name or ''}".strip()
-                member_info = f"{idx}. {full_name} (@{member_user.telegram_username or 'без имени'}) - {role}"
-                member_list.append(member_info)
+        for member in members:
+            role = "Староста" if member["is_leader"] else "Ассистент" if member["is_assistant"] else "Участник"
+            member_info = f"{member['position']}. {member['full_name']} (@{member['telegram_username'] or 'без имени'}) - {role}"
+            member_list.append(member_info)
 
         response = f"Участники группы «{group.name}»:\n" + "\n".join(member_list)
         
@@ -86,9 +109,9 @@ async def handle_group_members(message: Message, user_repo: UserRepo, group_repo
         await message.answer("Произошла ошибка при получении списка участников. Попробуйте позже.")
 
 @router.callback_query(F.data == "view_ban_list")
-async def start_view_ban_list(callback: CallbackQuery, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def start_view_ban_list(callback: CallbackQuery, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership or not user.group_membership.is_leader:
             await callback.message.answer("У вас нет прав для просмотра бан-листа.")
             await callback.answer()
@@ -115,7 +138,7 @@ async def start_view_ban_list(callback: CallbackQuery, state: FSMContext, user_r
         keyboard.adjust(2)
 
         await callback.message.answer(response, reply_markup=keyboard.as_markup())
-        await state.update_data(banned_users=banned_users, group_id=group.id)
+        await state.update_data(banned_users=banned_users, group_id=group.id, group_name=group.name)
         await callback.answer()
     except Exception as e:
         logger.error(f"Ошибка в start_view_ban_list: {e}")
@@ -124,9 +147,9 @@ async def start_view_ban_list(callback: CallbackQuery, state: FSMContext, user_r
         await callback.answer()
 
 @router.callback_query(F.data == "unban_member")
-async def start_unban_member(callback: CallbackQuery, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def start_unban_member(callback: CallbackQuery, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership or not user.group_membership.is_leader:
             await callback.message.answer("У вас нет прав для разблокировки пользователей.")
             await callback.answer()
@@ -164,7 +187,7 @@ async def cancel_ban_list(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.message(BanList.waiting_for_unban_number, F.text)
-async def process_unban_member(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo, bot: Bot):
+async def process_unban_member(message: Message, state: FSMContext, group_repo: GroupRepo):
     try:
         data = await state.get_data()
         banned_users = data.get("banned_users")
@@ -186,14 +209,17 @@ async def process_unban_member(message: Message, state: FSMContext, user_repo: U
 
 
         banned_user = banned_users[ban_number - 1]
-        group = await group_repo.get_group_by_id(group_id)
-        invite_token = await group_repo.create_invite(group_id=group_id, invited_by_user_id=message.from_user.id)
-        await group_repo.unban_user(group_id=group_id, user_id=banned_user["user_id"])
+        group_name = data.get("group_name") or (await group_repo.get_group_by_id(group_id)).name
+        # Ключ, разбан и уведомление фиксируются одной транзакцией
+        async with group_repo.transaction():
+            await group_repo.create_invite(group_id=group_id, invited_by_user_id=message.from_user.id)
+            await group_repo.unban_user(group_id=group_id, user_id=banned_user["user_id"])
+            await group_repo.enqueue_notifications(
+                [banned_user["user_id"]],
+                f"Вы были разблокированы в группе «{group_name}» и теперь можете снова присоединиться",
+                idempotency_key=f"member_unbanned:{group_id}:{message.chat.id}:{message.message_id}"
+            )
         full_name = f"{banned_user['last_name'] or ''} {banned_user['first_name']} {banned_user['middle_name'] or ''}".strip()
-        await bot.send_message(
-            banned_user["user_id"],
-            f"Вы были разблокированы в группе «{group.name}» и теперь можете снова присоединиться"
-        )
         await state.clear()
         await message.answer(
             f"Пользователь {full_name} разблокирован и уведомлён о возможности повторного присоединения.",
@@ -205,9 +231,9 @@ async def process_unban_member(message: Message, state: FSMContext, user_repo: U
         await message.answer("Произошла ошибка при разблокировке пользователя. Попробуйте позже.")
 
 @router.callback_query(F.data == "make_assistant")
-async def start_make_assistant(callback: CallbackQuery, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def start_make_assistant(callback: CallbackQuery, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership or not user.group_membership.is_leader:
             logger.warning(f"Попытка назначения ассистента без прав: user_id={callback.from_user.id}")
             await callback.message.answer("У вас нет прав для назначения ассистентов.")
@@ -215,7 +241,7 @@ async def start_make_assistant(callback: CallbackQuery, state: FSMContext, user_
             return
 
         group = user.group_membership.group
-        members = await group_repo.get_group_members(group.id)
+        members = await group_repo.get_group_member_rows(group.id)
         if not members:
             logger.info(f"Группа group_id={group.id} пуста")
             await callback.message.answer("В группе пока нет участников.")
@@ -226,7 +252,7 @@ async def start_make_assistant(callback: CallbackQuery, state: FSMContext, user_
         await state.set_state(MakeAssistant.waiting_for_member_number)
         keyboard = InlineKeyboardBuilder()
         keyboard.button(text="Отмена", callback_data="cancel_make_assistant")
-        await callback.message.answer("Введите номер участника, которого желаете сделать ассистентом:", reply_markup=keyboard.as_markup())
+        await callback.message.answer("Введите номера участников, которых желаете сделать ассистентами (например: 3,5,7-12):", reply_markup=keyboard.as_markup())
         await callback.answer()
     except Exception as e:
         logger.error(f"Ошибка в start_make_assistant: {e}")
@@ -248,7 +274,7 @@ async def cancel_make_assistant(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.message(MakeAssistant.waiting_for_member_number, F.text)
-async def process_make_assistant(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo, bot: Bot):
+async def process_make_assistant(message: Message, state: FSMContext, group_repo: GroupRepo):
     try:
         data = await state.get_data()
         members = data.get("members")
@@ -260,46 +286,31 @@ async def process_make_assistant(message: Message, state: FSMContext, user_repo:
             return
 
         try:
-            member_number = int(message.text.strip())
-            logger.debug(f"Введён номер участника: {member_number}")
-            if member_number < 1 or member_number > len(members):
-                logger.warning(f"Неверный номер участника: {member_number}, максимум: {len(members)}")
-                await message.answer("Неверный номер участника. Попробуйте снова.")
-                return
+            selected = [members[number - 1] for number in parse_member_numbers(message.text, len(members))]
         except ValueError:
-            logger.warning(f"Некорректный ввод номера участника: {message.text}")
-            await message.answer("Пожалуйста, введите корректный номер участника (число).")
+            await message.answer("Введите номера участников через запятую или диапазоном, например: 3,5,7-12.")
             return
 
-        member_to_update = members[member_number - 1]
-        member_user = await user_repo.get_user_with_group_info(member_to_update.user_id)
-        if not member_user:
-            logger.error(f"Пользователь user_id={member_to_update.user_id} не найден")
-            await message.answer("Ошибка: пользователь не найден.")
+        candidates = [member for member in selected if not member["is_leader"] and not member["is_assistant"]]
+        if not candidates:
+            await message.answer("Выбранные участники уже являются старостой или ассистентами.")
             await state.clear()
             return
 
-        if member_to_update.is_leader:
-            logger.info(f"Попытка назначить лидера user_id={member_to_update.user_id} ассистентом")
-            await message.answer("Этот пользователь уже является старостой.")
-            await state.clear()
-            return
-        if member_to_update.is_assistant:
-            logger.info(f"Пользователь user_id={member_to_update.user_id} уже ассистент")
-            await message.answer("Этот пользователь уже является ассистентом.")
-            await state.clear()
-            return
-
-        await group_repo.make_assistant(group_id=group_id, user_id=member_to_update.user_id)
-        await bot.send_message(
-            member_user.telegram_id,
-            "Поздравляем, вы назначены ассистентом! Используйте новое меню для управления группой.",
-            reply_markup=get_assistant_menu()
-        )
-        logger.info(f"Пользователь user_id={member_to_update.user_id} назначен ассистентом в группе group_id={group_id}")
+        # Роль меняется одним UPDATE, уведомления пишутся в outbox той же транзакцией
+        async with group_repo.transaction():
+            promoted = set(await group_repo.set_assistant(group_id, [member["user_id"] for member in candidates], True))
+            await group_repo.enqueue_notifications(
+                promoted,
+                "Поздравляем, вы назначены ассистентом! Используйте новое меню для управления группой.",
+                idempotency_key=f"assistant_added:{group_id}:{message.chat.id}:{message.message_id}",
+                reply_markup=get_assistant_menu()
+            )
+        promoted_members = [member for member in candidates if member["user_id"] in promoted]
+        logger.info(f"Назначено ассистентов в группе group_id={group_id}: {len(promoted_members)}")
         await state.clear()
         await message.answer(
-            f"Участник {member_user.first_name} {member_user.last_name or ''} назначен ассистентом.",
+            f"Назначены ассистентами ({len(promoted_members)}): {format_member_names(promoted_members)}.",
             reply_markup=get_main_menu_leader()
         )
     except Exception as e:
@@ -308,9 +319,9 @@ async def process_make_assistant(message: Message, state: FSMContext, user_repo:
         await message.answer("Произошла ошибка при назначении ассистента. Попробуйте позже.")
 
 @router.message(F.text == "🔗 Создать приглашение")
-async def start_create_invite(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def start_create_invite(message: Message, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if not user or not user.group_membership or not user.group_membership.is_leader:
             await message.answer("У вас нет прав для создания ключей доступа.")
             return
@@ -328,9 +339,9 @@ async def start_create_invite(message: Message, state: FSMContext, user_repo: Us
         await message.answer("Произошла ошибка при создании ключа доступа. Попробуйте позже.")
 
 @router.message(F.text == "🗑 Удалить группу")
-async def delete_group(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo, bot: Bot):
+async def delete_group(message: Message, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             logger.warning(f"Попытка удаления группы без членства: user_id={message.from_user.id}")
             await message.answer("Вы не состоите в группе.")
@@ -345,21 +356,19 @@ async def delete_group(message: Message, state: FSMContext, user_repo: UserRepo,
         group_name = group.name   # Сохраняем имя группы для уведомлений
         logger.info(f"Попытка удаления группы group_id={group_id} пользователем user_id={user.telegram_id}")
 
-        # Уведомляем всех участников группы об удалении
+        # Запоминаем участников до удаления: после него связи пропадут каскадом
         members = await group_repo.get_group_members(group_id)
-        for member in members:
-            if member.user_id != user.telegram_id:  # Не отправляем уведомление самому лидеру
-                try:
-                    await bot.send_message(
-                        member.user_id,
-                        f"Группа «{group_name}» была удалена старостой.",
-                        reply_markup=get_main_menu_unregistered()
-                    )
-                    logger.info(f"Уведомление об удалении группы отправлено пользователю user_id={member.user_id}")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке уведомления пользователю user_id={member.user_id}: {e}")
-
-        success = await group_repo.delete_group(group_id=group_id, leader_id=user.telegram_id)
+        member_ids = [member.user_id for member in members if member.user_id != user.telegram_id]
+        # Удаление группы и уведомления участникам фиксируются одной транзакцией
+        async with group_repo.transaction():
+            success = await group_repo.delete_group(group_id=group_id, leader_id=user.telegram_id)
+            if success:
+                await group_repo.enqueue_notifications(
+                    member_ids,
+                    f"Группа «{group_name}» была удалена старостой.",
+                    idempotency_key=f"group_deleted:{group_id}",
+                    reply_markup=get_main_menu_unregistered()
+                )
         if success:
             await state.clear()
             logger.info(f"Группа group_id={group_id} успешно удалена")
@@ -376,16 +385,16 @@ async def delete_group(message: Message, state: FSMContext, user_repo: UserRepo,
 
 
 @router.callback_query(F.data == "delete_member")
-async def start_delete_member(callback: CallbackQuery, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def start_delete_member(callback: CallbackQuery, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership or not user.group_membership.is_leader:
             await callback.message.answer("У вас нет прав для удаления участников.")
             await callback.answer()
             return
 
         group = user.group_membership.group
-        members = await group_repo.get_group_members(group.id)
+        members = await group_repo.get_group_member_rows(group.id)
         if not members:
             await callback.message.answer("В группе пока нет участников.")
             await callback.answer()
@@ -395,7 +404,7 @@ async def start_delete_member(callback: CallbackQuery, state: FSMContext, user_r
         await state.set_state(DeleteMember.waiting_for_member_number)
         keyboard = InlineKeyboardBuilder()
         keyboard.button(text="Отмена", callback_data="cancel_delete_member")
-        await callback.message.answer("Введите номер участника, которого желаете удалить:", reply_markup=keyboard.as_markup())
+        await callback.message.answer("Введите номера участников, которых желаете удалить (например: 3,5,7-12):", reply_markup=keyboard.as_markup())
         await callback.answer()
     except Exception as e:
         logger.error(f"Ошибка в start_delete_member: {e}")
@@ -404,16 +413,16 @@ async def start_delete_member(callback: CallbackQuery, state: FSMContext, user_r
         await callback.answer()
 
 @router.callback_query(F.data == "remove_assistant")
-async def start_remove_assistant(callback: CallbackQuery, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def start_remove_assistant(callback: CallbackQuery, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(callback.from_user.id)
+        user = current_user
         if not user or not user.group_membership or not user.group_membership.is_leader:
             await callback.message.answer("У вас нет прав для снятия ассистентов.")
             await callback.answer()
             return
 
         group = user.group_membership.group
-        members = await group_repo.get_group_members(group.id)
+        members = await group_repo.get_group_member_rows(group.id)
         if not members:
             await callback.message.answer("В группе пока нет участников.")
             await callback.answer()
@@ -423,7 +432,7 @@ async def start_remove_assistant(callback: CallbackQuery, state: FSMContext, use
         await state.set_state(RemoveAssistant.waiting_for_member_number)
         keyboard = InlineKeyboardBuilder()
         keyboard.button(text="Отмена", callback_data="cancel_remove_assistant")
-        await callback.message.answer("Введите номер участника, с которого желаете снять роль ассистента:", reply_markup=keyboard.as_markup())
+        await callback.message.answer("Введите номера участников, с которых желаете снять роль ассистента (например: 3,5,7-12):", reply_markup=keyboard.as_markup())
         await callback.answer()
     except Exception as e:
         logger.error(f"Ошибка в start_remove_assistant: {e}")
@@ -458,7 +467,7 @@ async def cancel_remove_assistant(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.message(DeleteMember.waiting_for_member_number, F.text)
-async def process_delete_member(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo, bot: Bot):
+async def process_delete_member(message: Message, state: FSMContext, group_repo: GroupRepo):
     try:
         data = await state.get_data()
         members = data.get("members")
@@ -469,36 +478,31 @@ async def process_delete_member(message: Message, state: FSMContext, user_repo:
             return
 
         try:
-            member_number = int(message.text.strip())
-            if member_number < 1 or member_number > len(members):
-                await message.answer("Неверный номер участника. Попробуйте снова.")
-                return
+            selected = [members[number - 1] for number in parse_member_numbers(message.text, len(members))]
         except ValueError:
-            await message.answer("Пожалуйста, введите корректный номер участника (число).")
+            await message.answer("Введите номера участников через запятую или диапазоном, например: 3,5,7-12.")
             return
 
-        member_to_delete = members[member_number - 1]
-        member_user = await user_repo.get_user_with_group_info(member_to_delete.user_id)
-        if not member_user:
-            await message.answer("Ошибка: пользователь не найден.")
-            await state.clear()
-            return
-
-        if member_user.telegram_id == message.from_user.id:
+        if any(member["user_id"] == message.from_user.id for member in selected):
             await message.answer("Вы не можете удалить самого себя из группы.")
             await state.clear()
             return
 
-        await group_repo.delete_member(group_id=group_id, user_id=member_to_delete.user_id)
-        await group_repo.ban_user(group_id=group_id, user_id=member_to_delete.user_id)
-        await bot.send_message(
-            member_user.telegram_id,
-            "Вас выгнали из группы и добавили в бан-лист.",
-            reply_markup=get_main_menu_unregistered()
-        )
+        # Исключение, бан и уведомления — одна транзакция: частичного состояния не остаётся
+        async with group_repo.transaction():
+            removed = await group_repo.delete_members(group_id, [member["user_id"] for member in selected])
+            if removed:
+                await group_repo.ban_users(group_id, removed)
+                await group_repo.enqueue_notifications(
+                    removed,
+                    "Вас выгнали из группы и добавили в бан-лист.",
+                    idempotency_key=f"member_banned:{group_id}:{message.chat.id}:{message.message_id}",
+                    reply_markup=get_main_menu_unregistered()
+                )
+        removed_members = [member for member in selected if member["user_id"] in removed]
         await state.clear()
         await message.answer(
-            f"Участник {member_user.first_name} {member_user.last_name or ''} удалён из группы и добавлен в бан-лист.",
+            f"Удалены из группы и добавлены в бан-лист ({len(removed_members)}): {format_member_names(removed_members)}.",
             reply_markup=get_main_menu_leader()
         )
     except Exception as e:
@@ -507,7 +511,7 @@ async def process_delete_member(message: Message, state: FSMContext, user_repo:
         await message.answer("Произошла ошибка при удалении участника. Попробуйте позже.")
 
 @router.message(RemoveAssistant.waiting_for_member_number, F.text)
-async def process_remove_assistant(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo, bot: Bot):
+async def process_remove_assistant(message: Message, state: FSMContext, group_repo: GroupRepo):
     try:
         data = await state.get_data()
         members = data.get("members")
@@ -518,38 +522,32 @@ async def process_remove_assistant(message: Message, state: FSMContext, user_rep
             return
 
         try:
-            member_number = int(message.text.strip())
-            if member_number < 1 or member_number > len(members):
-                await message.answer("Неверный номер участника. Попробуйте снова.")
-                return
+            selected = [members[number - 1] for number in parse_member_numbers(message.text, len(members))]
         except ValueError:
-            await message.answer("Пожалуйста, введите корректный номер участника (число).")
-            return
-
-        member_to_update = members[member_number - 1]
-        member_user = await user_repo.get_user_with_group_info(member_to_update.user_id)
-        if not member_user:
-            await message.answer("Ошибка: пользователь не найден.")
-            await state.clear()
+            await message.answer("Введите номера участников через запятую или диапазоном, например: 3,5,7-12.")
             return
 
-        if not member_to_update.is_assistant:
-            await message.answer("Этот пользователь не является ассистентом.")
+        candidates = [member for member in selected if member["is_assistant"]]
+        if not candidates:
+            await message.answer("Выбранные участники не являются ассистентами.")
             await state.clear()
             return
 
-        await group_repo.remove_assistant(group_id=group_id, user_id=member_to_update.user_id)
-        await bot.send_message(
-            member_user.telegram_id,
-            "Ваша роль ассистента снята. Используйте стандартное меню участника.",
-            reply_markup=get_regular_member_menu()
-        )
+        async with group_repo.transaction():
+            demoted = set(await group_repo.set_assistant(group_id, [member["user_id"] for member in candidates], False))
+            await group_repo.enqueue_notifications(
+                demoted,
+                "Ваша роль ассистента снята. Используйте стандартное меню участника.",
+                idempotency_key=f"assistant_removed:{group_id}:{message.chat.id}:{message.message_id}",
+                reply_markup=get_regular_member_menu()
+            )
+        demoted_members = [member for member in candidates if member["user_id"] in demoted]
         await state.clear()
         await message.answer(
-            f"С участника {member_user.first_name} {member_user.last_name or ''} снята роль ассистента.",
+            f"Роль ассистента снята ({len(demoted_members)}): {format_member_names(demoted_members)}.",
             reply_markup=get_main_menu_leader()
         )
     except Exception as e:
         logger.error(f"Ошибка в process_remove_assistant: {e}")
         await state.clear()
-        await message.answer("Произошла ошибка при снятии роли ассистента. Попробуйте позже.")
\ No newline at end of file
+        await message.answer("Произошла ошибка при снятии роли ассистента. Попробуйте позже.")
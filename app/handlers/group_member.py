@@ -1,18 +1,20 @@
 import logging
+from datetime import date
 from aiogram.fsm.context import FSMContext
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message
-from app.db.repository import UserRepo, GroupRepo
+from app.db.context import CurrentUser
+from app.db.repository import GroupRepo
 from app.keyboards.reply import get_main_menu_unregistered
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 @router.message(F.text == "🚪 Выйти из группы")
-async def leave_group(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def leave_group(message: Message, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await message.answer("Вы не состоите в группе.")
             return
@@ -36,15 +38,16 @@ async def leave_group(message: Message, state: FSMContext, user_repo: UserRepo,
         await message.answer("Произошла ошибка при выходе из группы. Попробуйте позже.")
 
 @router.message(F.text == "📅 События")
-async def handle_events_and_booking(message: Message, group_repo: GroupRepo, user_repo: UserRepo):
+async def handle_events_and_booking(message: Message, group_repo: GroupRepo, current_user: CurrentUser | None):
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await message.answer("У вас нет прав для управления событиями.")
             return
 
         group = user.group_membership.group
-        events = await group_repo.get_group_events(group.id)
+        # Прошедшие события не загружаются: один запрос по диапазону дат и индексу idx_events_group_id_date
+        events = await group_repo.get_group_events_in_range(group.id, date.today(), date.max)
         if not events:
             await message.answer("События отсутствуют. Создайте новое событие.")
         else:
@@ -56,38 +59,35 @@ async def handle_events_and_booking(message: Message, group_repo: GroupRepo, use
 
 @router.message(Command("calendar"))
 @router.message(F.text == "📅 Показать календарь")
-async def show_calendar_member(message: Message, state: FSMContext, user_repo: UserRepo, group_repo: GroupRepo):
+async def show_calendar_member(message: Message, state: FSMContext, group_repo: GroupRepo, current_user: CurrentUser | None):
     """Перенаправление на месячный календарь для обычных участников."""
     try:
         from app.handlers import calendar
-        await calendar.show_calendar(message, user_repo, group_repo, state)
+        await calendar.show_calendar(message, group_repo, state, current_user)
     except Exception as e:
         logger.error(f"Ошибка в show_calendar_member: {e}")
         await message.answer("Произошла ошибка. Попробуйте позже.")
 
 @router.message(F.text == "👥 Участники группы")
-async def handle_group_members_leader(message: Message, user_repo: UserRepo, group_repo: GroupRepo):
+async def handle_group_members_leader(message: Message, group_repo: GroupRepo, current_user: CurrentUser | None):
     """Обработчик: отображение списка участников группы с ролями."""
     try:
-        user = await user_repo.get_user_with_group_info(message.from_user.id)
+        user = current_user
         if not user or not user.group_membership:
             await message.answer("У вас нет прав для просмотра участников группы.")
             return
 
         group = user.group_membership.group
-        members = await group_repo.get_group_members(group.id)
+        members = await group_repo.get_group_member_rows(group.id)
         if not members:
             await message.answer("В группе пока нет участников.")
             return
 
         member_list = []
         for member in members:
-            member_user = await user_repo.get_user_with_group_info(member.user_id)
-            if member_user:
-                role = "Староста" if member.is_leader else "Ассистент" if member.is_assistant else "Участник"
-                full_name = f"{member_user.last_name or ''} {member_user.first_name} {member_user.middle_name or ''}".strip()
-                member_info = f"{full_name} (@{member_user.telegram_username or 'без имени'}) - {role}"
-                member_list.append(member_info)
+            role = "Староста" if member["is_leader"] else "Ассистент" if member["is_assistant"] else "Участник"
+            member_info = f"{member['full_name']} (@{member['telegram_username'] or 'без имени'}) - {role}"
+            member_list.append(member_info)
 
         response = f"Участники группы «{group.name}»:\n" + "\n".join(member_list)
         await message.answer(response)
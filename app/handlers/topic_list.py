@@ -10,6 +10,10 @@ import logging
 router = Router()
 logger = logging.getLogger(__name__)
 
+MAX_TOPICS = 50
+TOPICS_LIMIT_REACHED = f"Достигнуто максимальное количество тем ({MAX_TOPICS})"
+TOPIC_TITLE_PROMPT = "Введите название темы в сообщении (можно несколько, по одной в строке)"
+
 class TopicListStates(StatesGroup):
     waiting_for_topic_title = State()
     waiting_for_topic_description = State()
@@ -40,6 +44,13 @@ def format_topics(topics):
         for i, topic in enumerate(topics)
     )
 
+def topics_prompt(topics, skipped: int = 0) -> str:
+    """Текст сообщения со списком тем и приглашением ввести новые."""
+    text = f"Темы:\n{format_topics(topics)}\n{TOPIC_TITLE_PROMPT}"
+    if skipped:
+        text = f"{TOPICS_LIMIT_REACHED}, не добавлено: {skipped}.\n{text}"
+    return text
+
 @router.callback_query(F.data == "add_topics")
 async def start_add_topics(callback: CallbackQuery, state: FSMContext):
     logger.info(f"Начало добавления/редактирования тем для user_id={callback.from_user.id}")
@@ -49,7 +60,7 @@ async def start_add_topics(callback: CallbackQuery, state: FSMContext):
     max_participants = topic_list_data.get("max_participants_per_topic", 1)
     await callback.message.delete()
     sent_msg = await callback.message.answer(
-        text=f"Темы:\n{format_topics(topic_list_data['topics'])}\nВведите название темы в сообщении",
+        text=topics_prompt(topic_list_data['topics']),
         reply_markup=get_topic_list_keyboard(max_participants)
     )
     await state.update_data(last_message_id=sent_msg.message_id)
@@ -58,22 +69,25 @@ async def start_add_topics(callback: CallbackQuery, state: FSMContext):
 
 @router.message(TopicListStates.waiting_for_topic_title, F.text)
 async def add_topic_title(message: Message, state: FSMContext):
-    topic_title = message.text.strip()
-    if len(topic_title) < 1 or len(topic_title) > 255:
+    """Добавляет темы: каждая непустая строка сообщения — отдельная тема."""
+    titles = [line.strip() for line in message.text.splitlines() if line.strip()]
+    if not titles or any(len(title) > 255 for title in titles):
         await message.answer("Название темы должно быть от 1 до 255 символов.")
         return
     data = await state.get_data()
     topics = data["topic_list_data"]["topics"]
-    if len(topics) >= 50:
-        await message.answer("Достигнуто максимальное количество тем (50).")
+    free_slots = MAX_TOPICS - len(topics)
+    if free_slots <= 0:
+        await message.answer(f"{TOPICS_LIMIT_REACHED}.")
         return
-    topics.append({"id": str(uuid4()), "title": topic_title, "description": None})
+    skipped = max(0, len(titles) - free_slots)
+    topics.extend({"id": str(uuid4()), "title": title, "description": None} for title in titles[:free_slots])
     max_participants = data["topic_list_data"].get("max_participants_per_topic", 1)
     await state.update_data(topic_list_data={"topics": topics, "max_participants_per_topic": max_participants})
     await message.delete()
     await message.bot.delete_message(message.chat.id, data["last_message_id"])
     sent_msg = await message.answer(
-        text=f"Темы:\n{format_topics(topics)}\nВведите название темы в сообщении",
+        text=topics_prompt(topics, skipped),
         reply_markup=get_topic_list_keyboard(max_participants)
     )
     await state.update_data(last_message_id=sent_msg.message_id)
@@ -129,7 +143,7 @@ async def save_topic_description(message: Message, state: FSMContext):
     await message.delete()
     await message.bot.delete_message(message.chat.id, data["last_message_id"])
     sent_msg = await message.answer(
-        text=f"Темы:\n{format_topics(topics)}\nВведите название темы в сообщении",
+        text=topics_prompt(topics),
         reply_markup=get_topic_list_keyboard(max_participants)
     )
     await state.update_data(last_message_id=sent_msg.message_id)
@@ -167,7 +181,7 @@ async def delete_topic(message: Message, state: FSMContext):
     await message.delete()
     await message.bot.delete_message(message.chat.id, data["last_message_id"])
     sent_msg = await message.answer(
-        text=f"Темы:\n{format_topics(topics)}\nВведите название темы в сообщении",
+        text=topics_prompt(topics),
         reply_markup=get_topic_list_keyboard(max_participants)
     )
     await state.update_data(last_message_id=sent_msg.message_id)
@@ -200,7 +214,7 @@ async def save_max_participants(message: Message, state: FSMContext):
     await message.delete()
     await message.bot.delete_message(message.chat.id, data["last_message_id"])
     sent_msg = await message.answer(
-        text=f"Темы:\n{format_topics(topics)}\nВведите название темы в сообщении",
+        text=topics_prompt(topics),
         reply_markup=get_topic_list_keyboard(max_participants)
     )
     await state.update_data(last_message_id=sent_msg.message_id)
@@ -215,7 +229,7 @@ async def back_to_topics(callback: CallbackQuery, state: FSMContext):
     topics = data["topic_list_data"]["topics"]
     max_participants = data["topic_list_data"].get("max_participants_per_topic", 1)
     await callback.message.edit_text(
-        text=f"Темы:\n{format_topics(topics)}\nВведите название темы в сообщении",
+        text=topics_prompt(topics),
         reply_markup=get_topic_list_keyboard(max_participants)
     )
     await state.update_data(last_message_id=callback.message.message_id)
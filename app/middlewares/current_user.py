@@ -0,0 +1,20 @@
+import logging
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+class CurrentUserMiddleware(BaseMiddleware):
+    """Загружает CurrentUser один раз на апдейт и только для обработчиков, которые его объявили.
+
+    Подключается как inner-middleware на message и callback_query: к этому моменту
+    обработчик уже выбран, и по его параметрам видно, нужен ли current_user.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        if "current_user" not in data and handler_object and "current_user" in handler_object.params:
+            from_user = data.get("event_from_user")
+            data["current_user"] = await data["user_repo"].get_current_user(from_user.id) if from_user else None
+        return await handler(event, data)
@@ -1,26 +1,53 @@
 import logging
 from typing import Callable, Dict, Any, Awaitable
-from aiogram import BaseMiddleware, Bot
+from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from app.db.repository import UserRepo, GroupRepo
+from app.services.outbox import OutboxWorker
+from app.services.cache import CalendarCache, UserContextCache
 
 logger = logging.getLogger(__name__)
 
+# Параметры обработчика, для которых нужна сессия (current_user грузится через user_repo)
+DB_PARAMS = {"session", "user_repo", "group_repo", "current_user"}
+
 class DbSessionMiddleware(BaseMiddleware):
-    def __init__(self, session_pool: async_sessionmaker, bot: Bot):  # Убедимся, что bot передаётся
+    """Открывает сессию и создаёт репозитории, только если они нужны выбранному обработчику.
+
+    Подключается как inner-middleware на message и callback_query, поэтому
+    обработчик уже известен и по его параметрам видно, работает ли он с базой.
+    Чисто интерфейсные колбэки (переключение года, редактирование в FSM) идут
+    мимо сессии. Сама AsyncSession берёт соединение из пула только при первом
+    запросе, так что обработчик с попаданием в кэш тоже не занимает пул.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, outbox: OutboxWorker, calendar_cache: CalendarCache, user_cache: UserContextCache):
         super().__init__()
         self.session_pool = session_pool
-        self.bot = bot
+        self.outbox = outbox
+        self.calendar_cache = calendar_cache
+        self.user_cache = user_cache
 
     async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        if "session" in data or (
+            handler_object and not handler_object.varkw and not (handler_object.params & DB_PARAMS)
+        ):
+            return await handler(event, data)
+
         logger.info("Начало DbSessionMiddleware")
         try:
             async with self.session_pool() as session:
                 logger.info("Сессия создана")
                 data["session"] = session
-                data["user_repo"] = UserRepo(session)
-                data["group_repo"] = GroupRepo(session, bot=self.bot)  # Передаём bot в GroupRepo
+                data["user_repo"] = UserRepo(session, user_cache=self.user_cache)
+                data["group_repo"] = GroupRepo(
+                    session,
+                    outbox=self.outbox,
+                    calendar_cache=self.calendar_cache,
+                    user_cache=self.user_cache
+                )
                 result = await handler(event, data)
                 logger.info("Обработчик успешно выполнен")
                 return result
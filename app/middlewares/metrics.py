@@ -0,0 +1,70 @@
+from time import perf_counter
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType, Response
+from aiogram.types import TelegramObject
+from app.services.metrics import Metrics, UpdateStats, current_update
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время обработчика, число и время SQL-запросов и вызовов Bot API, ошибки — по имени обработчика.
+
+    Подключается как inner-middleware на message и callback_query первым, до
+    DbSessionMiddleware, чтобы в замер попали открытие сессии и загрузка
+    current_user. Запросы считаются через contextvar current_update, который
+    читают события движка и BotApiMetricsMiddleware.
+    """
+
+    def __init__(self, metrics: Metrics):
+        super().__init__()
+        self.metrics = metrics
+        self.names: dict[Callable, str] = {}
+
+    def _name(self, callback: Callable) -> str:
+        name = self.names.get(callback)
+        if name is None:
+            name = self.names[callback] = f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__qualname__}"
+        return name
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        labels = (("handler", self._name(handler_object.callback) if handler_object else "unknown"),)
+        stats = UpdateStats()
+        token = current_update.set(stats)
+        started = perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.metrics.inc("handler_errors_total", labels + (("error", type(e).__name__),))
+            raise
+        finally:
+            current_update.reset(token)
+            metrics = self.metrics
+            metrics.observe("handler_duration_seconds", labels, perf_counter() - started)
+            metrics.inc("handler_sql_statements_total", labels, stats.sql_count)
+            metrics.inc("handler_sql_seconds_total", labels, stats.sql_time)
+            metrics.inc("handler_api_calls_total", labels, stats.api_count)
+            metrics.inc("handler_api_seconds_total", labels, stats.api_time)
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Число, время и ошибки вызовов Bot API по методу; подключается к bot.session."""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot, method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        labels = (("method", method.__api_method__),)
+        started = perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.metrics.inc("bot_api_errors_total", labels + (("error", type(e).__name__),))
+            raise
+        finally:
+            elapsed = perf_counter() - started
+            self.metrics.observe("bot_api_duration_seconds", labels, elapsed)
+            stats = current_update.get()
+            if stats is not None:
+                stats.api_count += 1
+                stats.api_time += elapsed
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError, TelegramServerError
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class DeliveryResult:
+    """Итог доставки одного сообщения."""
+    chat_id: int
+    ok: bool
+    error: str | None = None
+    retryable: bool = False
+
+@dataclass
+class _Job:
+    chat_id: int
+    text: str
+    reply_markup: object | None
+    future: asyncio.Future
+    attempt: int = 0
+
+class RateLimiter:
+    """Token bucket: не больше rate отправок в секунду с коротким всплеском до burst."""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Broadcaster:
+    """Фоновая рассылка сообщений с учётом лимитов Telegram.
+
+    Сообщения ставятся в очередь и отправляются несколькими воркерами: общий поток
+    ограничен token bucket (~30 сообщений в секунду у Telegram), в один чат уходит
+    не чаще одного сообщения в per_chat_interval секунд. При TelegramRetryAfter
+    отправка приостанавливается для всех воркеров на указанное Telegram время.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = 25,
+        per_chat_interval: float = 1.0,
+        workers: int = 8,
+        max_attempts: int = 3
+    ):
+        self.bot = bot
+        self.limiter = RateLimiter(rate)
+        self.per_chat_interval = per_chat_interval
+        self.workers_count = workers
+        self.max_attempts = max_attempts
+        self.queue: asyncio.Queue[_Job] = asyncio.Queue()
+        self.chat_next_send: dict[int, float] = {}
+        self.paused_until = 0.0
+        self.workers: list[asyncio.Task] = []
+
+    async def start(self):
+        if self.workers:
+            return
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.workers_count)]
+        logger.info(f"Рассылка запущена: воркеров={self.workers_count}, лимит={self.limiter.rate}/с")
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается отправки уже поставленных сообщений и останавливает воркеров."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Рассылка остановлена с неотправленными сообщениями: {self.queue.qsize()}")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, chat_id: int, text: str, reply_markup=None) -> asyncio.Future:
+        """Ставит сообщение в очередь; future завершится DeliveryResult после доставки или отказа."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(_Job(chat_id=chat_id, text=text, reply_markup=reply_markup, future=future))
+        return future
+
+    async def _wait_turn(self, chat_id: int):
+        # Слот в чате резервируется до первого await, поэтому два воркера не отправят в один чат одновременно
+        now = time.monotonic()
+        slot = max(now, self.chat_next_send.get(chat_id, 0))
+        self.chat_next_send[chat_id] = slot + self.per_chat_interval
+        delay = max(slot, self.paused_until) - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.limiter.acquire()
+        # Повторная проверка: пауза могла начаться, пока воркер ждал токен
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, job: _Job) -> DeliveryResult | None:
+        """Отправляет сообщение; None означает, что задачу нужно повторить."""
+        job.attempt += 1
+        await self._wait_turn(job.chat_id)
+        try:
+            await self.bot.send_message(chat_id=job.chat_id, text=job.text, reply_markup=job.reply_markup)
+            return DeliveryResult(chat_id=job.chat_id, ok=True)
+        except TelegramRetryAfter as e:
+            logger.warning(f"Telegram просит подождать {e.retry_after} с перед следующей отправкой")
+            self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+            # Ожидание по RetryAfter не считается неудачной попыткой
+            job.attempt -= 1
+            return None
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            return DeliveryResult(chat_id=job.chat_id, ok=False, error=str(e))
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if job.attempt < self.max_attempts:
+                await asyncio.sleep(min(2 ** job.attempt, 30))
+                return None
+            return DeliveryResult(chat_id=job.chat_id, ok=False, error=str(e), retryable=True)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сообщения пользователю user_id={job.chat_id}: {e}", exc_info=True)
+            return DeliveryResult(chat_id=job.chat_id, ok=False, error=str(e), retryable=True)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                result = await self._send(job)
+                if result is None:
+                    self.queue.put_nowait(job)
+                elif not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.queue.task_done()
+                if len(self.chat_next_send) > 10000:
+                    now = time.monotonic()
+                    self.chat_next_send = {chat_id: at for chat_id, at in self.chat_next_send.items() if at > now}
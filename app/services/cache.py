@@ -0,0 +1,222 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Any, Callable, Hashable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """LRU-кэш в памяти процесса с ограничением по числу записей и суммарному весу.
+
+    Вес записи считает функция weigh (по умолчанию 1), так что ограничение
+    max_weight позволяет держать кэш в пределах примерного объёма памяти.
+    Если задан ttl, запись старше ttl секунд считается промахом.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_weight: int | None = None,
+        weigh: Callable[[Any], int] | None = None,
+        ttl: float | None = None
+    ):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.weigh = weigh or (lambda value: 1)
+        self.ttl = ttl
+        self.data: OrderedDict[Hashable, tuple[Any, int, float]] = OrderedDict()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key: Hashable, default=None):
+        item = self.data.get(key)
+        if item is not None and item[2] < time.monotonic():
+            self.pop(key)
+            self.expirations += 1
+            item = None
+        if item is None:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key: Hashable, value):
+        self.pop(key)
+        weight = self.weigh(value)
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self.data[key] = (value, weight, expires_at)
+        self.weight += weight
+        while len(self.data) > self.max_entries or (self.max_weight is not None and self.weight > self.max_weight):
+            _, (_, evicted_weight, _) = self.data.popitem(last=False)
+            self.weight -= evicted_weight
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        item = self.data.pop(key, None)
+        if item is None:
+            return None
+        self.weight -= item[1]
+        return item[0]
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        keys = [key for key, item in self.data.items() if predicate(key, item[0])]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+    def clear(self):
+        self.data.clear()
+        self.weight = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
+
+class CalendarEvent(NamedTuple):
+    """Данные события, нужные для отрисовки недели календаря."""
+    id: str
+    title: str
+    date: date
+    is_important: bool
+
+def week_start_of(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+class CalendarCache:
+    """Кэш недель календаря по ключу (group_id, week_start).
+
+    Запись меняется только через GroupRepo, который после коммита сбрасывает
+    затронутую неделю. Чтобы чтение, начатое до коммита, не положило в кэш
+    устаревшие данные, у каждой группы есть поколение: put сохраняет неделю,
+    только если поколение не изменилось с момента начала загрузки.
+    """
+
+    def __init__(self, max_entries: int = 5000, max_events: int = 100000):
+        # Вес недели = число событий + 1, чтобы пустые недели тоже учитывались
+        self.lru = LRUCache(max_entries, max_weight=max_events, weigh=lambda events: len(events) + 1)
+        self.generations: dict[str, int] = {}
+        self.epoch = 0
+        # Вызывается при каждой локальной инвалидации, чтобы разослать её другим процессам
+        self.on_invalidate: Callable[[dict], None] | None = None
+
+    def get(self, group_id, week_start: date) -> tuple[CalendarEvent, ...] | None:
+        return self.lru.get((str(group_id), week_start))
+
+    def generation(self, group_id) -> int:
+        # Оба счётчика только растут, поэтому сумма меняется при любой инвалидации
+        return self.epoch + self.generations.get(str(group_id), 0)
+
+    def put(self, group_id, week_start: date, events: tuple[CalendarEvent, ...], generation: int):
+        if self.generation(group_id) != generation:
+            return
+        self.lru.set((str(group_id), week_start), events)
+
+    def invalidate(self, group_id, day: date):
+        self._drop_week(str(group_id), week_start_of(day))
+        if self.on_invalidate:
+            self.on_invalidate({"group_id": str(group_id), "week": week_start_of(day).isoformat()})
+
+    def invalidate_group(self, group_id):
+        self._drop_group(str(group_id))
+        if self.on_invalidate:
+            self.on_invalidate({"group_id": str(group_id)})
+
+    def apply_remote(self, message: dict):
+        """Применяет инвалидацию, пришедшую из другого процесса."""
+        if "week" in message:
+            self._drop_week(message["group_id"], date.fromisoformat(message["week"]))
+        else:
+            self._drop_group(message["group_id"])
+
+    def reset(self):
+        """Сбрасывает весь кэш, например после потери связи с другими процессами."""
+        self.epoch += 1
+        self.lru.clear()
+
+    def _drop_week(self, group_id: str, week_start: date):
+        self.generations[group_id] = self.generations.get(group_id, 0) + 1
+        self.lru.pop((group_id, week_start))
+
+    def _drop_group(self, group_id: str):
+        self.generations[group_id] = self.generations.get(group_id, 0) + 1
+        removed = self.lru.pop_where(lambda key, events: key[0] == group_id)
+        logger.debug(f"Кэш календаря группы group_id={group_id} сброшен: {removed} недель")
+
+    def stats(self) -> dict:
+        return self.lru.stats()
+
+class UserContextCache:
+    """Кэш CurrentUser по telegram_id между апдейтами (TTL + LRU).
+
+    Членство и роли меняются редко, поэтому контекст пользователя живёт в памяти
+    процесса до ttl секунд. Репозитории сбрасывают запись после коммита любого
+    изменения членства; ttl ограничивает устаревание, если данные поменяли в
+    обход бота. Как и в CalendarCache, put отбрасывает значение, если во время
+    его загрузки произошла хоть одна инвалидация.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300):
+        self.lru = LRUCache(max_entries, ttl=ttl)
+        self.version = 0
+        self.on_invalidate: Callable[[dict], None] | None = None
+
+    def get(self, telegram_id: int):
+        return self.lru.get(telegram_id)
+
+    def put(self, telegram_id: int, current_user, version: int):
+        if version == self.version:
+            self.lru.set(telegram_id, current_user)
+
+    def invalidate(self, *telegram_ids: int):
+        self._drop_users(telegram_ids)
+        if self.on_invalidate:
+            self.on_invalidate({"telegram_ids": list(telegram_ids)})
+
+    def invalidate_group(self, group_id):
+        self._drop_group(str(group_id))
+        if self.on_invalidate:
+            self.on_invalidate({"group_id": str(group_id)})
+
+    def apply_remote(self, message: dict):
+        """Применяет инвалидацию, пришедшую из другого процесса."""
+        if "group_id" in message:
+            self._drop_group(message["group_id"])
+        else:
+            self._drop_users(message["telegram_ids"])
+
+    def reset(self):
+        """Сбрасывает весь кэш, например после потери связи с другими процессами."""
+        self.version += 1
+        self.lru.clear()
+
+    def _drop_users(self, telegram_ids):
+        self.version += 1
+        for telegram_id in telegram_ids:
+            self.lru.pop(telegram_id)
+
+    def _drop_group(self, group_id: str):
+        self.version += 1
+        self.lru.pop_where(
+            lambda telegram_id, user: user.group_membership is not None and user.group_membership.group.id == group_id
+        )
+
+    def stats(self) -> dict:
+        return self.lru.stats()
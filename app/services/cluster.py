@@ -0,0 +1,439 @@
+import asyncio
+import json
+import asyncpg
+import logging
+from datetime import timedelta
+from typing import Callable
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from app.db.models import QueuedUpdate, UpdatePartition
+from app.services.fsm_storage import PostgresStorage
+from app.services.updates import stale_callbacks
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock, которым ведущий процесс закрепляет за собой приём апдейтов
+LEADER_LOCK_KEY = 0x4C31FE11
+
+async def connect_direct(engine: AsyncEngine) -> asyncpg.Connection:
+    """Отдельное соединение asyncpg с параметрами движка, но не из его пула."""
+    _, params = engine.dialect.create_connect_args(engine.url)
+    # Эти параметры понимает только адаптер SQLAlchemy, а не asyncpg.connect
+    params.pop("prepared_statement_cache_size", None)
+    params.pop("prepared_statement_name_func", None)
+    return await asyncpg.connect(**params)
+
+def chat_key_of(update: Update) -> int:
+    """chat_id апдейта, как его видит FSM: для апдейтов без чата — id пользователя."""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat:
+        return context.chat.id
+    if context.user:
+        return context.user.id
+    return 0
+
+class UpdateQueue:
+    """Общая очередь апдейтов в таблице update_queue, разбитая на разделы по chat_id.
+
+    Раздел обрабатывает только воркер, который арендовал его строку в
+    update_partitions (FOR UPDATE SKIP LOCKED, аренда на lease секунд, пока
+    пачка в работе — продлевается), поэтому апдейты одного чата не
+    обрабатываются двумя процессами одновременно и идут по порядку update_id.
+    Запись апдейтов сопровождается NOTIFY, чтобы воркеры не ждали следующего опроса.
+    """
+
+    CHANNEL = "update_queue"
+
+    def __init__(self, session_pool: async_sessionmaker, partitions: int = 64, lease: float = 60):
+        self.session_pool = session_pool
+        self.partitions = partitions
+        self.lease = lease
+
+    def partition_of(self, chat_id: int) -> int:
+        return chat_id % self.partitions
+
+    async def ensure_partitions(self):
+        async with self.session_pool() as session:
+            await session.execute(
+                pg_insert(UpdatePartition)
+                .values([{"partition": partition} for partition in range(self.partitions)])
+                .on_conflict_do_nothing(index_elements=[UpdatePartition.partition])
+            )
+            await session.commit()
+
+    async def push(self, updates: list[Update]) -> None:
+        if not updates:
+            return
+        rows = [
+            {
+                "update_id": item.update_id,
+                "partition": self.partition_of(chat_key_of(item)),
+                "payload": item.model_dump(mode="json", exclude_none=True)
+            }
+            for item in updates
+        ]
+        async with self.session_pool() as session:
+            await session.execute(pg_insert(QueuedUpdate).values(rows).on_conflict_do_nothing(index_elements=[QueuedUpdate.update_id]))
+            # NOTIFY уходит подписчикам только после коммита
+            await session.execute(select(func.pg_notify(self.CHANNEL, "")))
+            await session.commit()
+
+    async def claim(self, worker_id: str, limit: int) -> list[int]:
+        """Арендует до limit свободных разделов, в которых есть апдейты."""
+        async with self.session_pool() as session:
+            free = (
+                select(UpdatePartition.partition)
+                .where(
+                    or_(UpdatePartition.owner.is_(None), UpdatePartition.lease_until < func.now()),
+                    select(QueuedUpdate.update_id).where(QueuedUpdate.partition == UpdatePartition.partition).exists()
+                )
+                .order_by(UpdatePartition.partition)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            result = await session.execute(
+                update(UpdatePartition)
+                .where(UpdatePartition.partition.in_(free.scalar_subquery()))
+                .values(owner=worker_id, lease_until=func.now() + timedelta(seconds=self.lease))
+                .returning(UpdatePartition.partition)
+            )
+            partitions = result.scalars().all()
+            await session.commit()
+            return partitions
+
+    async def fetch(self, partition: int, limit: int) -> list[QueuedUpdate]:
+        async with self.session_pool() as session:
+            result = await session.execute(
+                select(QueuedUpdate)
+                .where(QueuedUpdate.partition == partition)
+                .order_by(QueuedUpdate.update_id)
+                .limit(limit)
+            )
+            return result.scalars().all()
+
+    def _renew(self, worker_id: str, partition: int):
+        # Продлевается только действующая аренда: истёкшую мог уже забрать другой воркер
+        return (
+            update(UpdatePartition)
+            .where(
+                UpdatePartition.partition == partition,
+                UpdatePartition.owner == worker_id,
+                UpdatePartition.lease_until > func.now()
+            )
+            .values(lease_until=func.now() + timedelta(seconds=self.lease))
+            .returning(UpdatePartition.partition)
+        )
+
+    async def renew(self, worker_id: str, partition: int) -> bool:
+        """Продлевает аренду раздела; False, если она истекла или перешла другому воркеру."""
+        async with self.session_pool() as session:
+            owned = (await session.execute(self._renew(worker_id, partition))).first() is not None
+            await session.commit()
+            return owned
+
+    async def ack(self, worker_id: str, partition: int, update_ids: list[int]) -> bool:
+        """Удаляет обработанные апдейты и продлевает аренду; False, если раздел уже не наш.
+
+        Строка раздела блокируется продлением до удаления, поэтому claim другого
+        воркера не заберёт раздел посреди подтверждения. Без действующей аренды
+        ничего не удаляется.
+        """
+        async with self.session_pool() as session:
+            if (await session.execute(self._renew(worker_id, partition))).first() is None:
+                await session.rollback()
+                return False
+            await session.execute(delete(QueuedUpdate).where(QueuedUpdate.update_id.in_(update_ids)))
+            await session.commit()
+            return True
+
+    async def release(self, worker_id: str, partition: int):
+        async with self.session_pool() as session:
+            await session.execute(
+                update(UpdatePartition)
+                .where(
+                    UpdatePartition.partition == partition,
+                    UpdatePartition.owner == worker_id,
+                    UpdatePartition.lease_until > func.now()
+                )
+                .values(owner=None, lease_until=None)
+            )
+            await session.commit()
+
+    async def poll(self, bot: Bot, allowed_updates: list[str] | None = None, batch_size: int = 100, polling_timeout: int = 10, max_callback_age: float = 60):
+        """Забирает апдейты через getUpdates и складывает их в очередь (работа ведущего процесса).
+
+        Апдейты подтверждаются в Telegram (offset) только после записи в базу,
+        поэтому падение между получением и записью ничего не теряет.
+        """
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, limit=batch_size, timeout=polling_timeout, allowed_updates=allowed_updates)
+                if not updates:
+                    continue
+                stale = stale_callbacks(updates, max_callback_age)
+                if stale:
+                    logger.info(f"Пропущено устаревших колбэков: {len(stale)}")
+                await self.push([item for item in updates if item.update_id not in stale])
+                offset = updates[-1].update_id + 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при получении апдейтов: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+class ClusterWorker:
+    """Обрабатывает апдейты из UpdateQueue в этом процессе.
+
+    Одновременно держит не больше max_partitions разделов; каждый раздел
+    разбирается пачками по batch_size. Апдейты пачки передаются в Dispatcher
+    параллельно, порядок внутри пользователя сохраняет LaneIsolation. Перед
+    подтверждением пачки изменения FSM записываются в базу, чтобы следующий
+    владелец раздела увидел их, а при взятии раздела кэш FSM его чатов
+    сбрасывается.
+    """
+
+    def __init__(
+        self,
+        queue: UpdateQueue,
+        bot: Bot,
+        dispatcher: Dispatcher,
+        worker_id: str,
+        storage: PostgresStorage,
+        max_partitions: int = 8,
+        batch_size: int = 50,
+        poll_interval: float = 1
+    ):
+        self.queue = queue
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.worker_id = worker_id
+        self.storage = storage
+        self.max_partitions = max_partitions
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.active: dict[int, asyncio.Task] = {}
+        self.wakeup = asyncio.Event()
+        self.processed = 0
+
+    def wake(self):
+        self.wakeup.set()
+
+    async def run(self):
+        try:
+            while True:
+                self.wakeup.clear()
+                free = self.max_partitions - len(self.active)
+                if free > 0:
+                    try:
+                        claimed = await self.queue.claim(self.worker_id, free)
+                    except Exception as e:
+                        logger.error(f"Ошибка при аренде разделов очереди: {e}", exc_info=True)
+                        claimed = []
+                    if claimed:
+                        owned = set(claimed)
+                        self.storage.forget(lambda chat_id: self.queue.partition_of(chat_id) in owned)
+                    for partition in claimed:
+                        task = asyncio.create_task(self._drain(partition))
+                        self.active[partition] = task
+                        task.add_done_callback(lambda _, partition=partition: self._finished(partition))
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            tasks = list(self.active.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _finished(self, partition: int):
+        self.active.pop(partition, None)
+        self.wakeup.set()
+
+    async def _drain(self, partition: int):
+        try:
+            while True:
+                rows = await self.queue.fetch(partition, self.batch_size)
+                if not rows:
+                    break
+                updates = [Update.model_validate(row.payload, context={"bot": self.bot}) for row in rows]
+                heartbeat = asyncio.create_task(self._keep_lease(partition))
+                try:
+                    results = await asyncio.gather(*(self.dispatcher.feed_update(self.bot, item) for item in updates), return_exceptions=True)
+                    for item, result in zip(updates, results):
+                        if isinstance(result, Exception):
+                            logger.error(f"Ошибка при обработке апдейта update_id={item.update_id}: {result}", exc_info=result)
+                    self.processed += len(updates)
+                    await self.storage.flush()
+                finally:
+                    heartbeat.cancel()
+                    await asyncio.gather(heartbeat, return_exceptions=True)
+                if not await self.queue.ack(self.worker_id, partition, [row.update_id for row in rows]):
+                    logger.warning(f"Аренда раздела {partition} перешла другому воркеру")
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при обработке раздела {partition}: {e}", exc_info=True)
+        try:
+            await self.queue.release(self.worker_id, partition)
+        except Exception as e:
+            logger.error(f"Не удалось освободить раздел {partition}: {e}")
+
+    async def _keep_lease(self, partition: int):
+        """Продлевает аренду раздела, пока обрабатывается пачка, которая может идти дольше lease."""
+        while True:
+            await asyncio.sleep(self.queue.lease / 3)
+            try:
+                if not await self.queue.renew(self.worker_id, partition):
+                    logger.warning(f"Аренда раздела {partition} потеряна во время обработки пачки")
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду раздела {partition}: {e}")
+
+    def stats(self) -> dict:
+        return {"active_partitions": len(self.active), "processed": self.processed}
+
+class LeaderElection:
+    """Выбор ведущего процесса через pg_try_advisory_lock.
+
+    Блокировка сессионная и держится, пока живо отдельное соединение asyncpg
+    мимо пула движка (пул целиком остаётся обработчикам): если ведущий процесс
+    падает, Postgres снимает её, и ведущим становится другой.
+    """
+
+    def __init__(self, engine: AsyncEngine, key: int = LEADER_LOCK_KEY, retry_interval: float = 5):
+        self.engine = engine
+        self.key = key
+        self.retry_interval = retry_interval
+        self.connection: asyncpg.Connection | None = None
+
+    async def acquire(self):
+        """Ждёт, пока этот процесс не станет ведущим."""
+        while True:
+            connection = None
+            try:
+                connection = await connect_direct(self.engine)
+                if await connection.fetchval("SELECT pg_try_advisory_lock($1)", self.key):
+                    self.connection = connection
+                    return
+                await connection.close()
+            except asyncio.CancelledError:
+                if connection is not None:
+                    connection.terminate()
+                raise
+            except Exception as e:
+                # Временная недоступность базы не должна останавливать ожидание лидерства
+                logger.error(f"Ошибка при захвате блокировки ведущего: {e}")
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(self.retry_interval)
+
+    async def watch(self):
+        """Возвращает управление, когда соединение с блокировкой потеряно."""
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            try:
+                await self.connection.fetchval("SELECT 1")
+            except Exception as e:
+                logger.error(f"Соединение ведущего процесса потеряно: {e}")
+                return
+
+    async def release(self):
+        if self.connection:
+            connection, self.connection = self.connection, None
+            try:
+                # Закрытие соединения снимает сессионную блокировку
+                await connection.close(timeout=self.retry_interval)
+            except Exception as e:
+                logger.error(f"Ошибка при снятии блокировки ведущего: {e}")
+                connection.terminate()
+
+class ClusterBus:
+    """Рассылка сообщений между процессами через LISTEN/NOTIFY.
+
+    Подписки слушает отдельное соединение asyncpg мимо пула движка. Если оно
+    обрывается, bus переподключается и вызывает обработчики on_reconnect:
+    сообщения за время разрыва потеряны, поэтому кэши нужно сбросить целиком.
+    """
+
+    def __init__(self, engine: AsyncEngine, worker_id: str, health_interval: float = 30):
+        self.engine = engine
+        self.worker_id = worker_id
+        self.health_interval = health_interval
+        self.handlers: dict[str, Callable[[dict], None]] = {}
+        self.reconnect_handlers: list[Callable[[], None]] = []
+        self.outgoing: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+        self.connection: asyncpg.Connection | None = None
+        self.tasks: list[asyncio.Task] = []
+
+    def subscribe(self, channel: str, handler: Callable[[dict], None]):
+        self.handlers[channel] = handler
+
+    def on_reconnect(self, handler: Callable[[], None]):
+        self.reconnect_handlers.append(handler)
+
+    def publish(self, channel: str, message: dict):
+        """Ставит сообщение в очередь на отправку; можно вызывать из синхронного кода."""
+        self.outgoing.put_nowait((channel, json.dumps({**message, "origin": self.worker_id})))
+
+    async def start(self):
+        await self._listen()
+        self.tasks = [asyncio.create_task(self._send()), asyncio.create_task(self._health())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.connection:
+            await self.connection.close()
+            self.connection = None
+
+    async def _listen(self):
+        self.connection = await connect_direct(self.engine)
+        for channel in self.handlers:
+            await self.connection.add_listener(channel, self._receive)
+
+    def _receive(self, connection, pid, channel: str, payload: str):
+        try:
+            message = json.loads(payload) if payload else {}
+            if message.get("origin") == self.worker_id:
+                return
+            self.handlers[channel](message)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке сообщения канала {channel}: {e}", exc_info=True)
+
+    async def _send(self):
+        while True:
+            channel, payload = await self.outgoing.get()
+            try:
+                # Отправка берёт соединение из пула ненадолго и не зависит от переподключения LISTEN
+                async with self.engine.begin() as connection:
+                    await connection.execute(select(func.pg_notify(channel, payload)))
+            except Exception as e:
+                logger.error(f"Не удалось отправить сообщение в канал {channel}: {e}")
+
+    async def _health(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.connection.fetchval("SELECT 1")
+                continue
+            except Exception as e:
+                logger.error(f"Соединение LISTEN потеряно, переподключение: {e}")
+            self.connection.terminate()
+            try:
+                await self._listen()
+            except Exception as e:
+                logger.error(f"Не удалось переподключить LISTEN: {e}")
+                continue
+            for handler in self.reconnect_handlers:
+                handler()
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.db.models import FsmRecord
+from app.services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+class _Record:
+    __slots__ = ("chat_id", "state", "data")
+
+    def __init__(self, chat_id: int, state: str | None = None, data: dict | None = None):
+        self.chat_id = chat_id
+        self.state = state
+        self.data = data or {}
+
+def _normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Данные хранятся в том виде, в каком вернутся из JSONB: даты и UUID становятся строками
+    return json.loads(json.dumps(data, default=str))
+
+class PostgresStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_states с кэшем в памяти процесса.
+
+    Чтение идёт через LRU-кэш, запись только меняет запись в памяти и помечает
+    ключ изменённым. Фоновая задача через flush_delay секунд после первого
+    изменения пишет все изменённые ключи одним запросом, так что несколько
+    update_data за один апдейт дают одну запись в базу. При остановке
+    (Dispatcher вызывает close) несохранённые изменения записываются сразу.
+
+    Кэш не знает об изменениях из других процессов, поэтому апдейты одного
+    пользователя должны обрабатываться одним процессом.
+
+    Запись в кэше живёт не дольше cache_ttl секунд. Если задан idle_ttl,
+    start() запускает очистку: записи, не менявшиеся дольше idle_ttl,
+    удаляются из базы, и пользователь начинает с пустого состояния.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        key_builder: KeyBuilder | None = None,
+        cache_size: int = 10000,
+        cache_ttl: float | None = 3600,
+        flush_delay: float = 1.0,
+        idle_ttl: timedelta | None = None,
+        expire_interval: float = 3600
+    ):
+        self.session_pool = session_pool
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cache = LRUCache(cache_size, ttl=cache_ttl)
+        self.flush_delay = flush_delay
+        self.idle_ttl = idle_ttl
+        self.expire_interval = expire_interval
+        self.dirty: dict[str, _Record] = {}
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.expire_task: asyncio.Task | None = None
+        self.writes = 0
+        self.flushed_rows = 0
+        self.expired = 0
+
+    async def _load(self, key: StorageKey) -> tuple[str, _Record]:
+        storage_key = self.key_builder.build(key)
+        record = self.dirty.get(storage_key) or self.cache.get(storage_key)
+        if record is None:
+            async with self.session_pool() as session:
+                row = (await session.execute(
+                    select(FsmRecord.state, FsmRecord.data).where(FsmRecord.key == storage_key)
+                )).first()
+            record = _Record(key.chat_id, row.state, row.data) if row else _Record(key.chat_id)
+            # Пока шёл запрос, ключ мог измениться: побеждает то, что уже в памяти
+            record = self.dirty.get(storage_key) or self.cache.get(storage_key) or record
+            self.cache.set(storage_key, record)
+        return storage_key, record
+
+    def _mark_dirty(self, storage_key: str, record: _Record):
+        self.dirty[storage_key] = record
+        self.cache.set(storage_key, record)
+        self.writes += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        self.wakeup.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, record = await self._load(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._load(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key, record = await self._load(key)
+        record.data = _normalize(data)
+        self._mark_dirty(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._load(key)
+        return json.loads(json.dumps(record.data))
+
+    async def flush(self):
+        """Записывает все изменённые ключи; пустые записи удаляются."""
+        if not self.dirty:
+            return
+        batch, self.dirty = self.dirty, {}
+        rows = [
+            {"key": storage_key, "state": record.state, "data": record.data}
+            for storage_key, record in batch.items()
+            if record.state is not None or record.data
+        ]
+        empty = [storage_key for storage_key, record in batch.items() if record.state is None and not record.data]
+        try:
+            async with self.session_pool() as session:
+                if rows:
+                    stmt = pg_insert(FsmRecord).values(rows)
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[FsmRecord.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": func.now()}
+                    ))
+                if empty:
+                    await session.execute(delete(FsmRecord).where(FsmRecord.key.in_(empty)))
+                await session.commit()
+        except BaseException:
+            # Не записанные ключи возвращаются в очередь, если их не успели изменить снова
+            for storage_key, record in batch.items():
+                self.dirty.setdefault(storage_key, record)
+            raise
+        self.flushed_rows += len(batch)
+
+    def forget(self, predicate: Callable[[int], bool]) -> int:
+        """Убирает из кэша записи чатов, для которых predicate(chat_id) истинно.
+
+        Нужен, когда чаты переходят к этому процессу от другого: их состояние
+        могло измениться в базе, пока кэш здесь не обновлялся.
+        """
+        return self.cache.pop_where(lambda storage_key, record: storage_key not in self.dirty and predicate(record.chat_id))
+
+    async def expire_idle(self) -> int:
+        """Удаляет записи, не менявшиеся дольше idle_ttl, и возвращает их число."""
+        async with self.session_pool() as session:
+            result = await session.execute(
+                delete(FsmRecord)
+                .where(FsmRecord.updated_at < func.now() - self.idle_ttl)
+                .returning(FsmRecord.key)
+            )
+            keys = result.scalars().all()
+            await session.commit()
+        for storage_key in keys:
+            if storage_key not in self.dirty:
+                self.cache.pop(storage_key)
+        self.expired += len(keys)
+        if keys:
+            logger.info(f"Удалено неактивных состояний FSM: {len(keys)}")
+        return len(keys)
+
+    async def start(self):
+        if not self.expire_task and self.idle_ttl:
+            self.expire_task = asyncio.create_task(self._expire_loop())
+
+    async def _expire_loop(self):
+        while True:
+            try:
+                await self.expire_idle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при очистке неактивных состояний FSM: {e}", exc_info=True)
+            await asyncio.sleep(self.expire_interval)
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(self.flush_delay)
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояний FSM: {e}", exc_info=True)
+                self.wakeup.set()
+
+    async def close(self) -> None:
+        if self.expire_task:
+            self.expire_task.cancel()
+            await asyncio.gather(self.expire_task, return_exceptions=True)
+            self.expire_task = None
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить состояния FSM при остановке: {e}", exc_info=True)
+        logger.info(f"Статистика хранилища FSM: {self.stats()}")
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "dirty": len(self.dirty),
+            "writes": self.writes,
+            "flushed_rows": self.flushed_rows,
+            "expired": self.expired
+        }
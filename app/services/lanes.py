@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+logger = logging.getLogger(__name__)
+
+class _Lane:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+class LaneIsolation(BaseEventIsolation):
+    """Последовательные «полосы» апдейтов по ключу FSM и общий лимит обработчиков.
+
+    Передаётся в Dispatcher как events_isolation: FSMContextMiddleware берёт
+    lock(key) до чтения состояния, поэтому апдейты одного пользователя в чате
+    обрабатываются строго по очереди (asyncio.Lock будит ожидающих в порядке
+    прихода), а шаги FSM не перемешиваются. Разные пользователи идут
+    параллельно, но одновременно работают не больше concurrency обработчиков —
+    лимит выбирается по размеру пула соединений БД. Слот занимается только
+    после своей очереди, так что ждущие апдейты не держат слоты.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lanes: dict[StorageKey, _Lane] = {}
+        self.pending = 0
+        self.waiting_for_slot = 0
+        self.running = 0
+        self.processed = 0
+        self.max_pending = 0
+        self.max_lane_depth = 0
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = _Lane()
+        lane.depth += 1
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        self.max_lane_depth = max(self.max_lane_depth, lane.depth)
+        try:
+            async with lane.lock:
+                self.waiting_for_slot += 1
+                try:
+                    await self.semaphore.acquire()
+                finally:
+                    self.waiting_for_slot -= 1
+                self.running += 1
+                try:
+                    yield
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+                    self.semaphore.release()
+        finally:
+            lane.depth -= 1
+            self.pending -= 1
+            if not lane.depth:
+                del self.lanes[key]
+
+    async def close(self) -> None:
+        logger.info(f"Статистика очередей апдейтов: {self.stats()}")
+
+    def stats(self) -> dict:
+        return {
+            "lanes": len(self.lanes),
+            "pending": self.pending,
+            "waiting_for_slot": self.waiting_for_slot,
+            "running": self.running,
+            "processed": self.processed,
+            "max_pending": self.max_pending,
+            "max_lane_depth": self.max_lane_depth,
+            "concurrency": self.concurrency
+        }
@@ -0,0 +1,160 @@
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм длительности, в секундах
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        index = bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            self.counts[index] += 1
+
+class UpdateStats:
+    """Запросы к БД и Bot API, сделанные при обработке текущего апдейта."""
+    __slots__ = ("sql_count", "sql_time", "api_count", "api_time")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.api_count = 0
+        self.api_time = 0.0
+
+# Каждый апдейт обрабатывается в своей задаче, поэтому счётчики разных апдейтов не смешиваются
+current_update: ContextVar[UpdateStats | None] = ContextVar("current_update", default=None)
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metrics:
+    """Метрики процесса в памяти и их выдача в текстовом формате Prometheus.
+
+    Счётчики и гистограммы обновляются без блокировок (всё в одном event loop),
+    поэтому запись метрики стоит несколько словарных операций. Показатели,
+    которые уже считают другие компоненты (кэши, очереди апдейтов), подключаются
+    через add_collector и читаются только при запросе /metrics.
+    """
+
+    def __init__(self, prefix: str = "bot"):
+        self.prefix = prefix
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.collectors: list[tuple[str, Callable[[], dict]]] = []
+        self.runner: web.AppRunner | None = None
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float):
+        series = self.histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram()
+        histogram.observe(value)
+
+    def add_collector(self, name: str, collect: Callable[[], dict]):
+        """Числовые значения из collect() выдаются как gauge {prefix}_{name}_{ключ}."""
+        self.collectors.append((name, collect))
+
+    def instrument_engine(self, engine: AsyncEngine):
+        """Считает SQL-запросы и их время через события движка SQLAlchemy."""
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._metrics_started = perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = perf_counter() - context._metrics_started
+            self.inc("sql_statements_total")
+            self.inc("sql_seconds_total", value=elapsed)
+            stats = current_update.get()
+            if stats is not None:
+                stats.sql_count += 1
+                stats.sql_time += elapsed
+
+        @event.listens_for(sync_engine, "handle_error")
+        def handle_error(exception_context):
+            self.inc("sql_errors_total", (("error", type(exception_context.original_exception).__name__),))
+
+    def render(self) -> str:
+        lines = []
+        for name, series in self.counters.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {full_name} counter")
+            for labels, value in series.items():
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for name, series in self.histograms.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {full_name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{full_name}_bucket{_format_labels(labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{full_name}_bucket{_format_labels(labels, le)} {histogram.count}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {histogram.count}")
+        for name, collect in self.collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик {name}: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    full_name = f"{self.prefix}_{name}_{key}"
+                    lines.append(f"# TYPE {full_name} gauge")
+                    lines.append(f"{full_name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start_server(self, host: str, port: int, path: str = "/metrics"):
+        app = web.Application()
+        app.router.add_get(path, self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, host=host, port=port).start()
+        except OSError as e:
+            # Без метрик бот работать может, поэтому занятый порт не останавливает запуск
+            logger.error(f"Не удалось открыть порт метрик {host}:{port}: {e}")
+            await self.stop_server()
+            return
+        logger.info(f"Метрики доступны на http://{host}:{port}{path}")
+
+    async def stop_server(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Callable
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, ForceReply
+from sqlalchemy import select, update, delete, func, bindparam, Interval
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.db.models import OutboxMessage
+from app.services.broadcaster import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+MARKUP_TYPES = {cls.__name__: cls for cls in (InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, ForceReply)}
+
+def serialize_markup(reply_markup) -> dict | None:
+    """Превращает клавиатуру aiogram в JSON для хранения в outbox."""
+    if reply_markup is None:
+        return None
+    return {"type": type(reply_markup).__name__, "data": reply_markup.model_dump(mode="json", exclude_none=True)}
+
+def deserialize_markup(data: dict | None):
+    if not data:
+        return None
+    return MARKUP_TYPES[data["type"]].model_validate(data["data"])
+
+class OutboxWorker:
+    """Доставляет уведомления из таблицы notification_outbox.
+
+    Строки пишутся репозиторием в той же транзакции, что и изменение данных.
+    Воркер забирает их пачками через FOR UPDATE SKIP LOCKED (несколько процессов
+    не возьмут одну строку), отправляет через Broadcaster и отмечает результат.
+    Неудачные попытки откладываются с экспоненциальной задержкой, после
+    max_attempts строка получает статус dead и больше не отправляется.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        broadcaster: Broadcaster,
+        batch_size: int = 100,
+        poll_interval: float = 5,
+        max_attempts: int = 8,
+        base_delay: float = 5,
+        max_delay: float = 3600,
+        lease: float = 300,
+        keep_sent: timedelta = timedelta(days=7)
+    ):
+        self.session_pool = session_pool
+        self.broadcaster = broadcaster
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.keep_sent = keep_sent
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        # Вызывается при каждом wake, чтобы разбудить воркер в ведущем процессе
+        self.on_wake: Callable[[], None] | None = None
+
+    def wake(self):
+        """Сообщает воркеру о новых строках, чтобы не ждать следующего опроса."""
+        self.wakeup.set()
+        if self.on_wake:
+            self.on_wake()
+
+    async def start(self):
+        if not self.task:
+            self.task = asyncio.create_task(self._run())
+            logger.info("Воркер доставки уведомлений запущен")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        cleaned_at = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                processed = await self.drain_once()
+                if loop.time() - cleaned_at > 3600:
+                    await self.purge_sent()
+                    cleaned_at = loop.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в воркере доставки уведомлений: {e}", exc_info=True)
+                processed = 0
+            if processed >= self.batch_size:
+                continue
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> list[OutboxMessage]:
+        """Забирает пачку готовых к отправке строк и продлевает им аренду на время доставки."""
+        async with self.session_pool() as session:
+            due = (
+                select(OutboxMessage.id)
+                .where(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= func.now())
+                .order_by(OutboxMessage.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            result = await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(due.scalar_subquery()))
+                .values(next_attempt_at=func.now() + timedelta(seconds=self.lease))
+                .returning(OutboxMessage)
+            )
+            messages = result.scalars().all()
+            await session.commit()
+            return messages
+
+    async def drain_once(self) -> int:
+        """Отправляет одну пачку уведомлений и возвращает её размер."""
+        messages = await self._claim()
+        if not messages:
+            return 0
+
+        futures = []
+        for message in messages:
+            try:
+                reply_markup = deserialize_markup(message.reply_markup)
+            except Exception as e:
+                logger.error(f"Не удалось восстановить клавиатуру уведомления id={message.id}: {e}")
+                reply_markup = None
+            futures.append(self.broadcaster.submit(message.chat_id, message.body, reply_markup))
+        results = await asyncio.gather(*futures)
+
+        sent_ids = []
+        failures = []
+        for message, result in zip(messages, results):
+            if result.ok:
+                sent_ids.append(message.id)
+                continue
+            attempts = message.attempts + 1
+            if not result.retryable or attempts >= self.max_attempts:
+                logger.warning(f"Уведомление id={message.id} для user_id={message.chat_id} переведено в dead: {result.error}")
+                status, delay = "dead", 0
+            else:
+                status, delay = "pending", min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            failures.append({
+                "b_id": message.id,
+                "b_status": status,
+                "b_attempts": attempts,
+                "b_error": result.error,
+                "b_delay": timedelta(seconds=delay)
+            })
+
+        async with self.session_pool() as session:
+            if sent_ids:
+                await session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_(sent_ids))
+                    .values(status="sent", sent_at=func.now(), last_error=None)
+                )
+            if failures:
+                table = OutboxMessage.__table__
+                # executemany: все неудачи одной пачки отмечаются за один проход
+                await session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(
+                        status=bindparam("b_status"),
+                        attempts=bindparam("b_attempts"),
+                        last_error=bindparam("b_error"),
+                        next_attempt_at=func.now() + bindparam("b_delay", type_=Interval)
+                    ),
+                    failures
+                )
+            await session.commit()
+
+        delivered = sum(1 for result in results if result.ok)
+        logger.info(f"Outbox: доставлено {delivered} из {len(messages)}")
+        return len(messages)
+
+    async def purge_sent(self):
+        """Удаляет давно доставленные уведомления; dead-строки остаются для разбора."""
+        async with self.session_pool() as session:
+            result = await session.execute(
+                delete(OutboxMessage)
+                .where(OutboxMessage.status == "sent", OutboxMessage.sent_at < func.now() - self.keep_sent)
+            )
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"Outbox: удалено {result.rowcount} доставленных уведомлений")
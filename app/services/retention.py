@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Callable, TYPE_CHECKING
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+if TYPE_CHECKING:
+    from app.db.repository import GroupRepo
+
+logger = logging.getLogger(__name__)
+
+class EventRetentionJob:
+    """Фоновая очистка событий старше retention_days.
+
+    Удаление идёт порциями по chunk_size событий, каждая в своей короткой
+    транзакции (GroupRepo.purge_events_before), с паузой между порциями,
+    чтобы очистка семестра не держала блокировки и не занимала пул надолго.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker,
+        group_repo_factory: Callable[[AsyncSession], "GroupRepo"],
+        retention_days: int,
+        chunk_size: int = 1000,
+        pause: float = 0.5,
+        interval: float = 24 * 3600
+    ):
+        self.session_pool = session_pool
+        self.group_repo_factory = group_repo_factory
+        self.retention_days = retention_days
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+
+    async def purge(self, cutoff: date) -> int:
+        """Удаляет все события раньше cutoff и возвращает их число."""
+        total = 0
+        while True:
+            async with self.session_pool() as session:
+                deleted = await self.group_repo_factory(session).purge_events_before(cutoff, self.chunk_size)
+            total += deleted
+            if deleted < self.chunk_size:
+                break
+            logger.info(f"Очистка событий до {cutoff}: удалено {total}")
+            await asyncio.sleep(self.pause)
+        logger.info(f"Очистка событий до {cutoff} завершена: удалено {total}")
+        return total
+
+    async def start(self):
+        if not self.task and self.retention_days > 0:
+            self.task = asyncio.create_task(self._run())
+            logger.info(f"Очистка старых событий включена: хранить {self.retention_days} дней")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.purge(date.today() - timedelta(days=self.retention_days))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при очистке старых событий: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
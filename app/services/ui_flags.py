@@ -0,0 +1,68 @@
+import time
+from typing import Hashable
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from app.services.cache import LRUCache
+
+class UiFlags:
+    """Эфемерные флаги интерфейса пользователя (например, скрыта ли кнопка «Посмотреть очередь»).
+
+    По умолчанию хранятся в памяти процесса, а не в данных FSM: число записей
+    ограничено (LRU), запись живёт не дольше ttl секунд, после чего флаг снова
+    имеет значение по умолчанию. Хранить стоит только отличия от значения по умолчанию.
+
+    Если передан storage (режим нескольких процессов), флаги пишутся в общее
+    хранилище FSM под отдельным destiny: следующий апдейт пользователя может
+    попасть в другой процесс. Данные сценариев FSM при этом не меняются, у
+    пользователя хранится не больше max_per_user последних флагов, а
+    устаревают они вместе с неактивными записями FSM.
+    """
+
+    DESTINY = "ui_flags"
+
+    def __init__(
+        self,
+        max_entries: int = 50000,
+        ttl: float = 24 * 3600,
+        storage: BaseStorage | None = None,
+        bot_id: int | None = None,
+        max_per_user: int = 100
+    ):
+        self.lru = LRUCache(max_entries, ttl=ttl)
+        self.storage = storage
+        self.bot_id = bot_id
+        self.max_per_user = max_per_user
+
+    def _key(self, user_id: int) -> StorageKey:
+        # Флаги меняются из личного чата с ботом, где chat_id совпадает с user_id
+        return StorageKey(bot_id=self.bot_id, chat_id=user_id, user_id=user_id, destiny=self.DESTINY)
+
+    async def get(self, user_id: int, name: str, default=None):
+        if self.storage is None:
+            return self.lru.get((user_id, name), default)
+        flag = (await self.storage.get_data(self._key(user_id))).get(name)
+        return flag["value"] if flag else default
+
+    async def set(self, user_id: int, name: str, value: Hashable):
+        if self.storage is None:
+            self.lru.set((user_id, name), value)
+            return
+        key = self._key(user_id)
+        flags = await self.storage.get_data(key)
+        # JSONB не сохраняет порядок ключей, поэтому у каждого флага своё время записи
+        flags[name] = {"value": value, "at": time.time()}
+        if len(flags) > self.max_per_user:
+            newest = sorted(flags, key=lambda flag_name: flags[flag_name]["at"], reverse=True)[:self.max_per_user]
+            flags = {flag_name: flags[flag_name] for flag_name in newest}
+        await self.storage.set_data(key, flags)
+
+    async def reset(self, user_id: int, name: str):
+        if self.storage is None:
+            self.lru.pop((user_id, name))
+            return
+        key = self._key(user_id)
+        flags = await self.storage.get_data(key)
+        if flags.pop(name, None) is not None:
+            await self.storage.set_data(key, flags)
+
+    def stats(self) -> dict:
+        return self.lru.stats()
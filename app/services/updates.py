@@ -0,0 +1,221 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.db.models import BotOffset
+from app.services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+def _update_date(update: Update) -> datetime | None:
+    for event in (update.message, update.edited_message, update.my_chat_member, update.chat_member):
+        if event is not None:
+            return event.date
+    return None
+
+def stale_callbacks(updates: list[Update], max_age: float) -> set[int]:
+    """update_id колбэков из пачки, которые заведомо старше max_age секунд.
+
+    У callback_query нет времени отправки, но апдейты идут по порядку update_id,
+    поэтому колбэк не моложе любого апдейта с датой, пришедшего после него.
+    Это оценка снизу: колбэк без датированных апдейтов после себя считается свежим.
+    """
+    now = datetime.now(timezone.utc)
+    stale = set()
+    newer_date = None
+    for update in reversed(updates):
+        event_date = _update_date(update)
+        if event_date is not None:
+            newer_date = event_date if newer_date is None else min(newer_date, event_date)
+        elif update.callback_query and newer_date and now - newer_date > timedelta(seconds=max_age):
+            stale.add(update.update_id)
+    return stale
+
+class UpdateTracker:
+    """Хранит в bot_offsets последний обработанный update_id и отсекает повторы.
+
+    Отметка offset означает, что все апдейты до неё включительно обработаны:
+    пока апдейт в работе, отметка не проходит дальше него. Поэтому begin
+    вызывается сразу при получении апдейта, до очереди в LaneIsolation, а
+    Telegram подтверждаются только апдейты не выше отметки (poll, вебхук
+    отвечает после обработки). В базу отметка пишется раз в flush_interval
+    секунд и при остановке. После перезапуска апдейты начиная с offset + 1
+    приходят снова — всё, что ниже, Telegram считает подтверждённым.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, bot_id: int, flush_interval: float = 5, recent_size: int = 10000):
+        self.session_pool = session_pool
+        self.bot_id = bot_id
+        self.flush_interval = flush_interval
+        # Отметка из базы на момент запуска: всё, что не выше, точно уже обработано
+        self.restored = 0
+        self.offset = 0
+        self.flushed = 0
+        self.max_seen = 0
+        self.in_flight: set[int] = set()
+        self.recent = LRUCache(recent_size)
+        self.duplicates = 0
+        # Устанавливается, когда отметка сдвинулась
+        self.progress = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    async def load(self):
+        async with self.session_pool() as session:
+            stored = await session.scalar(select(BotOffset.update_id).where(BotOffset.bot_id == self.bot_id))
+        self.restored = self.offset = self.flushed = self.max_seen = stored or 0
+        logger.info(f"Последний обработанный update_id: {self.offset}")
+
+    def begin(self, update_id: int) -> bool:
+        """Отмечает апдейт как взятый в работу; False, если он уже обрабатывался."""
+        if update_id <= self.restored or self.recent.get(update_id) is not None:
+            self.duplicates += 1
+            return False
+        self.recent.set(update_id, True)
+        self.in_flight.add(update_id)
+        self.max_seen = max(self.max_seen, update_id)
+        return True
+
+    def done(self, update_id: int):
+        self.in_flight.discard(update_id)
+        watermark = min(self.in_flight) - 1 if self.in_flight else self.max_seen
+        if watermark > self.offset:
+            self.offset = watermark
+            self.progress.set()
+
+    def skip(self, update_id: int):
+        """Пропускает апдейт без обработки, но сдвигает отметку так же, как обработанный."""
+        if self.begin(update_id):
+            self.done(update_id)
+
+    async def flush(self):
+        offset = self.offset
+        if offset <= self.flushed:
+            return
+        async with self.session_pool() as session:
+            stmt = pg_insert(BotOffset).values(bot_id=self.bot_id, update_id=offset)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[BotOffset.bot_id],
+                set_={"update_id": func.greatest(BotOffset.update_id, stmt.excluded.update_id), "updated_at": func.now()}
+            ))
+            await session.commit()
+        self.flushed = offset
+
+    async def feed(self, bot: Bot, dispatcher: Dispatcher, update: Update):
+        """Обрабатывает апдейт, для которого begin уже вернул True, и отмечает завершение."""
+        try:
+            await dispatcher.feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке апдейта update_id={update.update_id}: {e}", exc_info=True)
+        finally:
+            self.done(update.update_id)
+
+    async def catch_up(self, bot: Bot, dispatcher: Dispatcher, allowed_updates: list[str] | None = None, batch_size: int = 100, max_callback_age: float = 60) -> int:
+        """Обрабатывает апдейты, накопившиеся, пока бот был остановлен.
+
+        Работает через getUpdates, поэтому вебхук к этому моменту должен быть снят.
+        Пачка обрабатывается параллельно (порядок внутри одного пользователя
+        сохраняет LaneIsolation), следующая запрашивается после завершения
+        предыдущей — с offset, который подтверждает уже обработанные.
+        """
+        offset = self.offset + 1 if self.offset else None
+        processed = skipped = 0
+        while True:
+            updates = await bot.get_updates(offset=offset, limit=batch_size, timeout=0, allowed_updates=allowed_updates)
+            if not updates:
+                break
+            stale = stale_callbacks(updates, max_callback_age)
+            for update_id in stale:
+                self.skip(update_id)
+            fresh = [update for update in updates if update.update_id not in stale and self.begin(update.update_id)]
+            await asyncio.gather(*(self.feed(bot, dispatcher, update) for update in fresh))
+            processed += len(fresh)
+            skipped += len(stale)
+            offset = updates[-1].update_id + 1
+        if processed or skipped:
+            logger.info(f"Догоняющая обработка: обработано {processed}, пропущено устаревших колбэков {skipped}")
+        await self.flush()
+        return processed
+
+    async def poll(
+        self,
+        bot: Bot,
+        dispatcher: Dispatcher,
+        allowed_updates: list[str] | None = None,
+        batch_size: int = 100,
+        polling_timeout: int = 10,
+        max_callback_age: float = 60
+    ):
+        """Получает апдейты через getUpdates, пока задачу не отменят.
+
+        Запрос всегда идёт с offset = отметка + 1, так что Telegram подтверждаются
+        только обработанные апдейты: упадёт процесс — остальные придут снова.
+        Апдейты выше отметки, которые уже в работе, Telegram присылает повторно,
+        они пропускаются; если нового в ответе нет, следующий запрос ждёт сдвига
+        отметки. Поэтому обгонять самый старый незавершённый апдейт можно не
+        больше чем на batch_size. При отмене начатые апдейты дообрабатываются.
+        """
+        tasks: set[asyncio.Task] = set()
+        try:
+            while True:
+                self.progress.clear()
+                updates = await bot.get_updates(
+                    offset=self.offset + 1,
+                    limit=batch_size,
+                    timeout=polling_timeout,
+                    allowed_updates=allowed_updates
+                )
+                # Telegram отдаёт апдейты по возрастанию, и begin вызывается для каждого по порядку
+                new = [update for update in updates if update.update_id > self.max_seen]
+                stale = stale_callbacks(new, max_callback_age)
+                for update in new:
+                    if update.update_id in stale:
+                        self.skip(update.update_id)
+                    elif self.begin(update.update_id):
+                        task = asyncio.create_task(self.feed(bot, dispatcher, update))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                if updates and not new:
+                    try:
+                        await asyncio.wait_for(self.progress.wait(), timeout=polling_timeout)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if tasks:
+                logger.info(f"Ожидание обработки апдейтов: {len(tasks)}")
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def start(self):
+        if not self.task:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить update_id при остановке: {e}", exc_info=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении update_id: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "offset": self.offset,
+            "flushed": self.flushed,
+            "in_flight": len(self.in_flight),
+            "duplicates": self.duplicates
+        }
@@ -0,0 +1,53 @@
+import logging
+from typing import Any
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+from app.services.cluster import UpdateQueue
+from app.services.updates import UpdateTracker
+
+logger = logging.getLogger(__name__)
+
+class TrackedRequestHandler(SimpleRequestHandler):
+    """Приём апдейтов по вебхуку с ответом Telegram после обработки.
+
+    Пока апдейт обрабатывается, Telegram его не считает доставленным: если
+    процесс упадёт или остановится раньше, апдейт придёт снова. Число
+    одновременных запросов ограничивает сам Telegram через max_connections.
+    Повторную доставку уже обработанного апдейта отсекает UpdateTracker, а
+    ошибка обработчика пишется в лог и не вызывает повтора — как при getUpdates.
+    Секрет из X-Telegram-Bot-Api-Secret-Token проверяет SimpleRequestHandler.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, tracker: UpdateTracker, secret_token: str | None = None, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=False, secret_token=secret_token, **data)
+        self.tracker = tracker
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        update = Update.model_validate(await request.json(loads=bot.session.json_loads), context={"bot": bot})
+        if self.tracker.begin(update.update_id):
+            await self.tracker.feed(bot, self.dispatcher, update)
+        else:
+            logger.info(f"Повторный апдейт update_id={update.update_id} пропущен")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+class QueueRequestHandler(SimpleRequestHandler):
+    """Приём апдейтов по вебхуку в общую очередь update_queue (режим нескольких воркеров).
+
+    Telegram получает ответ только после записи апдейта в базу: если запись
+    не удалась, сервер отвечает ошибкой и Telegram повторит доставку.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, queue: UpdateQueue, secret_token: str | None = None, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.queue = queue
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = Update.model_validate(await request.json(loads=bot.session.json_loads), context={"bot": bot})
+        await self.queue.push([update])
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        # Сессия бота нужна воркерам этого процесса и после остановки вебхука
+        pass
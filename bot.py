@@ -1,11 +1,36 @@
 import asyncio
 import logging
+import signal
+from datetime import timedelta
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from app.handlers import common, calendar, group_assistant, group_leader, group_member, topic_list
 from app.middlewares.db import DbSessionMiddleware
-from app.config import DATABASE_URL, BOT_TOKEN
+from app.middlewares.current_user import CurrentUserMiddleware
+from app.middlewares.metrics import HandlerMetricsMiddleware, BotApiMetricsMiddleware
+from app.services.broadcaster import Broadcaster
+from app.services.outbox import OutboxWorker
+from app.services.cache import CalendarCache, UserContextCache
+from app.services.retention import EventRetentionJob
+from app.services.webhook import TrackedRequestHandler, QueueRequestHandler
+from app.services.cluster import UpdateQueue, ClusterWorker, ClusterBus, LeaderElection
+from app.services.lanes import LaneIsolation
+from app.services.updates import UpdateTracker
+from app.services.fsm_storage import PostgresStorage
+from app.services.ui_flags import UiFlags
+from app.services.metrics import Metrics
+from app.db.repository import GroupRepo
+from app.config import DATABASE_URL, BOT_TOKEN, DB_POOL_SIZE, DB_MAX_OVERFLOW, BROADCAST_RATE, BROADCAST_WORKERS, CALENDAR_CACHE_WEEKS, CALENDAR_CACHE_EVENTS, USER_CACHE_SIZE, USER_CACHE_TTL, EVENT_RETENTION_DAYS, EVENT_PURGE_CHUNK
+from app.config import BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, HANDLER_CONCURRENCY, TELEGRAM_API_URL
+from app.config import CATCHUP_BATCH, STALE_CALLBACK_AGE, OFFSET_FLUSH_INTERVAL, FSM_STORAGE, FSM_CACHE_SIZE, FSM_FLUSH_DELAY
+from app.config import FSM_CACHE_TTL, FSM_IDLE_DAYS, UI_FLAGS_SIZE, UI_FLAGS_TTL
+from app.config import WORKER_MODE, WORKER_ID, UPDATE_PARTITIONS, WORKER_PARTITIONS, PARTITION_LEASE
+from app.config import METRICS_HOST, METRICS_PORT
 
 # Настройка логирования
 logging.basicConfig(
@@ -14,6 +39,121 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def run_webhook(bot: Bot, dp: Dispatcher, handler: SimpleRequestHandler, lifecycle: bool = True) -> None:
+    """Принимает апдейты по вебхуку, пока задачу не отменят.
+
+    lifecycle: вызывать ли startup/shutdown диспетчера вместе с запуском и остановкой сервера.
+    """
+    app = web.Application()
+    handler.register(app, path=WEBHOOK_PATH)
+    if lifecycle:
+        setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+    try:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=min(HANDLER_CONCURRENCY, 100),
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Вебхук слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await asyncio.Event().wait()
+    finally:
+        # Сначала перестаём принимать запросы и дожидаемся начатых апдейтов
+        await runner.cleanup()
+
+async def run_polling(bot: Bot, dp: Dispatcher, tracker: UpdateTracker) -> None:
+    """Получает апдейты через getUpdates, подтверждая Telegram только обработанные."""
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    logger.info("Бот получает апдейты через getUpdates")
+    try:
+        await tracker.poll(
+            bot,
+            dp,
+            allowed_updates=dp.resolve_used_update_types(),
+            batch_size=CATCHUP_BATCH,
+            max_callback_age=STALE_CALLBACK_AGE
+        )
+    finally:
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+
+async def run_cluster(
+    bot: Bot,
+    dp: Dispatcher,
+    engine: AsyncEngine,
+    session_maker: async_sessionmaker,
+    storage: PostgresStorage,
+    calendar_cache: CalendarCache,
+    user_cache: UserContextCache,
+    broadcaster: Broadcaster,
+    outbox: OutboxWorker,
+    metrics: Metrics
+) -> None:
+    """Режим нескольких процессов: обработка разделов общей очереди, а у ведущего — ещё и приём апдейтов.
+
+    Уведомления из outbox отправляет только ведущий, иначе общий поток в
+    Telegram рос бы вместе с числом процессов, а лимит BROADCAST_RATE у бота один.
+    """
+    queue = UpdateQueue(session_maker, partitions=UPDATE_PARTITIONS, lease=PARTITION_LEASE)
+    worker = ClusterWorker(queue, bot, dp, WORKER_ID, storage=storage, max_partitions=WORKER_PARTITIONS)
+    leader = LeaderElection(engine)
+    bus = ClusterBus(engine, WORKER_ID)
+    # Инвалидации кэшей расходятся по всем процессам
+    for channel, cache in (("calendar_cache", calendar_cache), ("user_cache", user_cache)):
+        cache.on_invalidate = lambda message, channel=channel: bus.publish(channel, message)
+        bus.subscribe(channel, cache.apply_remote)
+        bus.on_reconnect(cache.reset)
+    bus.subscribe(UpdateQueue.CHANNEL, lambda message: worker.wake())
+    outbox.on_wake = lambda: bus.publish("outbox", {})
+    bus.subscribe("outbox", lambda message: outbox.wakeup.set())
+    metrics.add_collector("worker", worker.stats)
+
+    async def poll_updates():
+        await bot.delete_webhook()
+        await queue.poll(bot, allowed_updates=dp.resolve_used_update_types(), batch_size=CATCHUP_BATCH, max_callback_age=STALE_CALLBACK_AGE)
+
+    await queue.ensure_partitions()
+    await bus.start()
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    worker_task = asyncio.create_task(worker.run())
+    logger.info(f"Воркер {WORKER_ID} запущен")
+    try:
+        while True:
+            await leader.acquire()
+            logger.info(f"Воркер {WORKER_ID} стал ведущим и принимает апдейты")
+            await broadcaster.start()
+            await outbox.start()
+            if BOT_MODE == "webhook":
+                handler = QueueRequestHandler(dispatcher=dp, bot=bot, queue=queue, secret_token=WEBHOOK_SECRET)
+                ingest = run_webhook(bot, dp, handler, lifecycle=False)
+            else:
+                ingest = poll_updates()
+            tasks = [asyncio.create_task(ingest), asyncio.create_task(leader.watch())]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await outbox.stop()
+                await broadcaster.stop()
+                await leader.release()
+            for task in done:
+                if not task.cancelled() and task.exception():
+                    logger.error(f"Приём апдейтов остановлен: {task.exception()}", exc_info=task.exception())
+            logger.warning(f"Воркер {WORKER_ID} больше не ведущий")
+            await asyncio.sleep(leader.retry_interval)
+    finally:
+        worker_task.cancel()
+        await asyncio.gather(worker_task, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await bus.stop()
+        logger.info(f"Статистика воркера: {worker.stats()}")
+
 async def main() -> None:
     """Запуск бота и настройка всех компонентов."""
     logger.info("🚀 Запуск бота...")
@@ -28,17 +168,70 @@ async def main() -> None:
     engine = create_async_engine(
         DATABASE_URL,
         echo=False,
-        pool_size=5,
-        max_overflow=10,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
         pool_timeout=30,
         pool_recycle=1800
     )
     session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    # SIGTERM останавливает бота как Ctrl+C: отменой main, чтобы начатые апдейты были дообработаны
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    metrics = Metrics()
+    metrics.instrument_engine(engine)
 
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(token=BOT_TOKEN, session=session)
+    bot.session.middleware(BotApiMetricsMiddleware(metrics))
+    # Апдейты одного пользователя идут по очереди, разных — параллельно в пределах HANDLER_CONCURRENCY
+    lanes = LaneIsolation(concurrency=HANDLER_CONCURRENCY)
+    if FSM_STORAGE == "postgres":
+        storage = PostgresStorage(
+            session_maker,
+            cache_size=FSM_CACHE_SIZE,
+            cache_ttl=FSM_CACHE_TTL,
+            flush_delay=FSM_FLUSH_DELAY,
+            idle_ttl=timedelta(days=FSM_IDLE_DAYS) if FSM_IDLE_DAYS > 0 else None
+        )
+    else:
+        storage = MemoryStorage()
+    dp = Dispatcher(storage=storage, events_isolation=lanes)
+    dp["lanes"] = lanes
+    broadcaster = Broadcaster(bot, rate=BROADCAST_RATE, workers=BROADCAST_WORKERS)
+    outbox = OutboxWorker(session_maker, broadcaster)
+    calendar_cache = CalendarCache(max_entries=CALENDAR_CACHE_WEEKS, max_events=CALENDAR_CACHE_EVENTS)
+    dp["calendar_cache"] = calendar_cache
+    user_cache = UserContextCache(max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+    dp["user_cache"] = user_cache
+    # В режиме cluster следующий апдейт пользователя может попасть в другой процесс, поэтому флаги лежат в общем хранилище
+    ui_flags = UiFlags(
+        max_entries=UI_FLAGS_SIZE,
+        ttl=UI_FLAGS_TTL,
+        storage=storage if WORKER_MODE == "cluster" else None,
+        bot_id=bot.id
+    )
+    dp["ui_flags"] = ui_flags
+    retention = EventRetentionJob(
+        session_maker,
+        lambda session: GroupRepo(session, outbox=outbox, calendar_cache=calendar_cache, user_cache=user_cache),
+        retention_days=EVENT_RETENTION_DAYS,
+        chunk_size=EVENT_PURGE_CHUNK
+    )
 
-    dp.update.middleware(DbSessionMiddleware(session_pool=session_maker, bot=bot))
+    # В режиме cluster повторы и накопившиеся апдейты обрабатывает общая очередь
+    tracker = None
+    if WORKER_MODE == "single":
+        tracker = UpdateTracker(session_maker, bot_id=bot.id, flush_interval=OFFSET_FLUSH_INTERVAL)
+
+    # Сессия и контекст пользователя создаются после выбора обработчика и только если он их запросил
+    db_middleware = DbSessionMiddleware(session_pool=session_maker, outbox=outbox, calendar_cache=calendar_cache, user_cache=user_cache)
+    handler_metrics = HandlerMetricsMiddleware(metrics)
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(handler_metrics)
+        observer.middleware(db_middleware)
+        observer.middleware(CurrentUserMiddleware())
     dp.include_router(group_member.router)
     dp.include_router(common.router)
     dp.include_router(group_leader.router)
@@ -46,15 +239,59 @@ async def main() -> None:
     dp.include_router(group_assistant.router)
     dp.include_router(topic_list.router)
 
-    await bot.delete_webhook(drop_pending_updates=True)
+    metrics.add_collector("lanes", lanes.stats)
+    metrics.add_collector("calendar_cache", calendar_cache.stats)
+    metrics.add_collector("user_cache", user_cache.stats)
+    metrics.add_collector("ui_flags", ui_flags.stats)
+    if isinstance(storage, PostgresStorage):
+        metrics.add_collector("fsm_storage", storage.stats)
+    if tracker:
+        metrics.add_collector("updates", tracker.stats)
+    if METRICS_PORT:
+        await metrics.start_server(METRICS_HOST, METRICS_PORT)
+
+    if tracker:
+        # Накопившиеся апдейты не сбрасываются: вебхук снимается, чтобы забрать их через getUpdates
+        await bot.delete_webhook()
+        await tracker.load()
+        await tracker.start()
+    if isinstance(storage, PostgresStorage):
+        await storage.start()
+    if WORKER_MODE == "single":
+        await broadcaster.start()
+        await outbox.start()
+    await retention.start()
     try:
-        await dp.start_polling(bot)
+        if WORKER_MODE == "cluster":
+            await run_cluster(bot, dp, engine, session_maker, storage, calendar_cache, user_cache, broadcaster, outbox, metrics)
+        else:
+            if BOT_MODE == "webhook":
+                await tracker.catch_up(
+                    bot,
+                    dp,
+                    allowed_updates=dp.resolve_used_update_types(),
+                    batch_size=CATCHUP_BATCH,
+                    max_callback_age=STALE_CALLBACK_AGE
+                )
+                handler = TrackedRequestHandler(dispatcher=dp, bot=bot, tracker=tracker, secret_token=WEBHOOK_SECRET)
+                await run_webhook(bot, dp, handler)
+            else:
+                await run_polling(bot, dp, tracker)
     finally:
+        if tracker:
+            await tracker.stop()
+        await retention.stop()
+        await outbox.stop()
+        await broadcaster.stop()
+        logger.info(f"Статистика кэша календаря: {calendar_cache.stats()}")
+        logger.info(f"Статистика кэша пользователей: {user_cache.stats()}")
+        logger.info(f"Статистика флагов интерфейса: {ui_flags.stats()}")
+        await metrics.stop_server()
         await bot.session.close()
         await engine.dispose()
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
-    except (KeyboardInterrupt, SystemExit):
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
         logger.info("🛑 Бот остановлен!")
\ No newline at end of file
@@ -0,0 +1,5 @@
+CREATE TABLE bot_offsets (
+    bot_id BIGINT PRIMARY KEY,
+    update_id BIGINT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
@@ -0,0 +1,15 @@
+CREATE TABLE update_queue (
+    update_id BIGINT PRIMARY KEY,
+    partition INTEGER NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+CREATE INDEX idx_update_queue_partition ON update_queue (partition, update_id);
+
+-- Строки разделов 0..UPDATE_PARTITIONS-1 бот создаёт при запуске
+CREATE TABLE update_partitions (
+    partition INTEGER PRIMARY KEY,
+    owner VARCHAR(255),
+    lease_until TIMESTAMP WITH TIME ZONE
+);
@@ -0,0 +1,15 @@
+CREATE TABLE notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    idempotency_key VARCHAR(255) NOT NULL UNIQUE,
+    chat_id BIGINT NOT NULL,
+    body TEXT NOT NULL,
+    reply_markup JSONB,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    sent_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX idx_outbox_pending ON notification_outbox (next_attempt_at) WHERE status = 'pending';
@@ -0,0 +1,26 @@
+-- Одна очередь на событие: ищем очередь по event_id без полного просмотра таблицы
+CREATE UNIQUE INDEX IF NOT EXISTS idx_queues_event_id ON queues (event_id);
+
+-- Перенос очередей, которые раньше хранились в users.notification_settings
+INSERT INTO queues (event_id, title, max_participants)
+SELECT DISTINCT ON (e.id) e.id, e.title, (kv.value->>'max_slots')::int
+FROM users u
+CROSS JOIN LATERAL jsonb_each(u.notification_settings) AS kv
+JOIN events e ON e.id::text = kv.key
+WHERE jsonb_typeof(u.notification_settings) = 'object'
+  AND jsonb_typeof(kv.value) = 'object'
+  AND kv.value ? 'max_slots'
+ORDER BY e.id
+ON CONFLICT (event_id) DO NOTHING;
+
+INSERT INTO queueparticipants (queue_id, user_id, position)
+SELECT DISTINCT ON (q.id, entry.key::int) q.id, (entry.value #>> '{}')::bigint, entry.key::int
+FROM users u
+CROSS JOIN LATERAL jsonb_each(u.notification_settings) AS kv
+JOIN queues q ON q.event_id::text = kv.key
+CROSS JOIN LATERAL jsonb_each(kv.value->'entries') AS entry
+JOIN users member ON member.telegram_id = (entry.value #>> '{}')::bigint
+WHERE jsonb_typeof(u.notification_settings) = 'object'
+  AND jsonb_typeof(kv.value->'entries') = 'object'
+ORDER BY q.id, entry.key::int
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,124 @@
+from datetime import date
+from types import SimpleNamespace
+from app.services.cache import LRUCache, CalendarCache, CalendarEvent, UserContextCache, week_start_of
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+def test_lru_limits_total_weight():
+    cache = LRUCache(10, max_weight=5, weigh=len)
+    cache.set("a", "xxx")
+    cache.set("b", "xx")
+    cache.set("c", "xx")
+    assert cache.get("a") is None
+    assert cache.weight == 4
+    # Значение тяжелее всего кэша не сохраняется
+    cache.set("d", "xxxxxx")
+    assert cache.get("d") is None
+    assert cache.weight == 4
+
+def test_lru_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.services.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(10, ttl=5)
+    cache.set("a", 1)
+    now[0] += 4
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.expirations == 1 and len(cache) == 0
+
+def test_lru_pop_where():
+    cache = LRUCache(10)
+    for key in range(5):
+        cache.set(key, key)
+    assert cache.pop_where(lambda key, value: value % 2 == 0) == 3
+    assert sorted(cache.data) == [1, 3]
+
+WEEK = week_start_of(date(2024, 5, 15))
+EVENTS = (CalendarEvent(id="1", title="Лекция", date=date(2024, 5, 15), is_important=False),)
+
+def test_calendar_put_and_get():
+    cache = CalendarCache()
+    cache.put("g", WEEK, EVENTS, cache.generation("g"))
+    assert cache.get("g", WEEK) == EVENTS
+
+def test_calendar_put_is_dropped_after_invalidation():
+    cache = CalendarCache()
+    generation = cache.generation("g")
+    # Событие изменили, пока неделя загружалась из базы
+    cache.invalidate("g", date(2024, 5, 16))
+    cache.put("g", WEEK, EVENTS, generation)
+    assert cache.get("g", WEEK) is None
+    cache.put("g", WEEK, EVENTS, cache.generation("g"))
+    assert cache.get("g", WEEK) == EVENTS
+
+def test_calendar_invalidation_of_other_group_keeps_put():
+    cache = CalendarCache()
+    generation = cache.generation("g")
+    cache.invalidate_group("other")
+    cache.put("g", WEEK, EVENTS, generation)
+    assert cache.get("g", WEEK) == EVENTS
+
+def test_calendar_invalidate_group_drops_all_weeks():
+    cache = CalendarCache()
+    cache.put("g", WEEK, EVENTS, cache.generation("g"))
+    cache.put("g", date(2024, 5, 20), (), cache.generation("g"))
+    cache.put("h", WEEK, (), cache.generation("h"))
+    cache.invalidate_group("g")
+    assert cache.get("g", WEEK) is None and cache.get("g", date(2024, 5, 20)) is None
+    assert cache.get("h", WEEK) == ()
+
+def test_calendar_reset_changes_every_generation():
+    cache = CalendarCache()
+    generation = cache.generation("g")
+    cache.reset()
+    cache.put("g", WEEK, EVENTS, generation)
+    assert cache.get("g", WEEK) is None
+
+def test_calendar_notifies_and_applies_remote_invalidation():
+    sent = []
+    local, remote = CalendarCache(), CalendarCache()
+    local.on_invalidate = sent.append
+    remote.put("g", WEEK, EVENTS, remote.generation("g"))
+    local.invalidate("g", date(2024, 5, 17))
+    assert sent == [{"group_id": "g", "week": WEEK.isoformat()}]
+    remote.apply_remote(sent[0])
+    assert remote.get("g", WEEK) is None
+
+def _user(group_id):
+    return SimpleNamespace(group_membership=SimpleNamespace(group=SimpleNamespace(id=group_id)))
+
+def test_user_cache_put_is_dropped_after_invalidation():
+    cache = UserContextCache()
+    version = cache.version
+    cache.invalidate(2)
+    cache.put(1, _user("g"), version)
+    assert cache.get(1) is None
+    cache.put(1, _user("g"), cache.version)
+    assert cache.get(1) is not None
+
+def test_user_cache_invalidate_group():
+    cache = UserContextCache()
+    cache.put(1, _user("g"), cache.version)
+    cache.put(2, _user("h"), cache.version)
+    cache.put(3, SimpleNamespace(group_membership=None), cache.version)
+    cache.invalidate_group("g")
+    assert cache.get(1) is None
+    assert cache.get(2) is not None and cache.get(3) is not None
+
+def test_user_cache_apply_remote():
+    sent = []
+    local, remote = UserContextCache(), UserContextCache()
+    local.on_invalidate = sent.append
+    remote.put(1, _user("g"), remote.version)
+    local.invalidate(1)
+    remote.apply_remote(sent[0])
+    assert remote.get(1) is None
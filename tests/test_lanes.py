@@ -0,0 +1,71 @@
+import asyncio
+from aiogram.fsm.storage.base import StorageKey
+from app.services.lanes import LaneIsolation
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+async def _handle(lanes, key, log, name, delay=0.01):
+    async with lanes.lock(key):
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+
+def test_same_key_runs_in_arrival_order():
+    async def main():
+        lanes = LaneIsolation(10)
+        log = []
+        await asyncio.gather(*(_handle(lanes, _key(1), log, i) for i in range(5)))
+        return lanes, log
+    lanes, log = asyncio.run(main())
+    assert log == [(step, i) for i in range(5) for step in ("start", "end")]
+    assert lanes.max_lane_depth == 5
+    assert lanes.lanes == {} and lanes.pending == 0 and lanes.processed == 5
+
+def test_different_keys_run_in_parallel_up_to_concurrency():
+    async def main():
+        lanes = LaneIsolation(2)
+        running = peak = 0
+
+        async def handle(user_id):
+            nonlocal running, peak
+            async with lanes.lock(_key(user_id)):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(handle(user_id) for user_id in range(6)))
+        return lanes, peak
+    lanes, peak = asyncio.run(main())
+    assert peak == 2
+    assert lanes.running == 0 and lanes.processed == 6
+
+def test_waiting_lane_does_not_hold_a_slot():
+    async def main():
+        lanes = LaneIsolation(1)
+        log = []
+        # Второй апдейт пользователя 1 ждёт свою очередь и не должен занимать
+        # единственный слот, пока его может использовать пользователь 2
+        await asyncio.gather(
+            _handle(lanes, _key(1), log, "1a"),
+            _handle(lanes, _key(1), log, "1b"),
+            _handle(lanes, _key(2), log, "2")
+        )
+        return log
+    log = asyncio.run(main())
+    assert log.index(("start", "2")) < log.index(("start", "1b"))
+
+def test_lane_is_released_after_error():
+    async def main():
+        lanes = LaneIsolation(1)
+        try:
+            async with lanes.lock(_key(1)):
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        async with lanes.lock(_key(1)):
+            pass
+        return lanes
+    lanes = asyncio.run(main())
+    assert lanes.lanes == {} and lanes.processed == 2
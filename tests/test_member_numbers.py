@@ -0,0 +1,20 @@
+import pytest
+from app.handlers.group_leader import parse_member_numbers
+
+def test_single_numbers_and_ranges():
+    assert parse_member_numbers("3,5,7-12", 20) == [3, 5, 7, 8, 9, 10, 11, 12]
+
+def test_spaces_and_duplicates():
+    assert parse_member_numbers(" 2 1, 2,1-3 ", 5) == [1, 2, 3]
+
+def test_range_of_one_number():
+    assert parse_member_numbers("4-4", 4) == [4]
+
+@pytest.mark.parametrize("text", ["12-7", "0", "a", "1-a", "-3", "21", "1-21", "", " , "])
+def test_invalid_input(text):
+    with pytest.raises(ValueError):
+        parse_member_numbers(text, 20)
+
+def test_huge_range_is_rejected_before_expanding():
+    with pytest.raises(ValueError):
+        parse_member_numbers("1-1000000000000", 20)
@@ -0,0 +1,43 @@
+from app.services.metrics import Metrics
+
+def test_render_counters_with_labels():
+    metrics = Metrics()
+    metrics.inc("handler_errors_total", (("handler", "calendar.join_queue"), ("error", "ValueError")))
+    metrics.inc("handler_errors_total", (("handler", "calendar.join_queue"), ("error", "ValueError")))
+    metrics.inc("sql_statements_total", value=3)
+    lines = metrics.render().splitlines()
+    assert "# TYPE bot_handler_errors_total counter" in lines
+    assert 'bot_handler_errors_total{handler="calendar.join_queue",error="ValueError"} 2' in lines
+    assert "bot_sql_statements_total 3" in lines
+
+def test_render_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    labels = (("method", "sendMessage"),)
+    for value in (0.001, 0.02, 0.3, 20):
+        metrics.observe("bot_api_duration_seconds", labels, value)
+    lines = metrics.render().splitlines()
+    assert "# TYPE bot_bot_api_duration_seconds histogram" in lines
+    assert 'bot_bot_api_duration_seconds_bucket{method="sendMessage",le="0.005"} 1' in lines
+    assert 'bot_bot_api_duration_seconds_bucket{method="sendMessage",le="0.025"} 2' in lines
+    assert 'bot_bot_api_duration_seconds_bucket{method="sendMessage",le="0.5"} 3' in lines
+    assert 'bot_bot_api_duration_seconds_bucket{method="sendMessage",le="10.0"} 3' in lines
+    assert 'bot_bot_api_duration_seconds_bucket{method="sendMessage",le="+Inf"} 4' in lines
+    assert 'bot_bot_api_duration_seconds_count{method="sendMessage"} 4' in lines
+    assert any(line.startswith('bot_bot_api_duration_seconds_sum{method="sendMessage"} 20.32') for line in lines)
+
+def test_render_escapes_label_values():
+    metrics = Metrics()
+    metrics.inc("errors_total", (("error", 'say "hi"\\\n'),))
+    assert 'bot_errors_total{error="say \\"hi\\"\\\\\\n"} 1' in metrics.render()
+
+def test_render_collectors_skip_non_numbers_and_errors():
+    metrics = Metrics()
+    metrics.add_collector("cache", lambda: {"entries": 5, "hit_ratio": 0.5, "enabled": True, "name": "x"})
+    metrics.add_collector("broken", lambda: 1 / 0)
+    lines = metrics.render().splitlines()
+    assert lines == [
+        "# TYPE bot_cache_entries gauge",
+        "bot_cache_entries 5",
+        "# TYPE bot_cache_hit_ratio gauge",
+        "bot_cache_hit_ratio 0.5"
+    ]
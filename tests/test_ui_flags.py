@@ -0,0 +1,51 @@
+import asyncio
+import json
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from app.services.ui_flags import UiFlags
+
+def test_memory_flags():
+    async def main():
+        flags = UiFlags()
+        assert await flags.get(1, "hidden", False) is False
+        await flags.set(1, "hidden", True)
+        assert await flags.get(1, "hidden", False) is True
+        assert await flags.get(2, "hidden", False) is False
+        await flags.reset(1, "hidden")
+        assert await flags.get(1, "hidden", False) is False
+    asyncio.run(main())
+
+def test_shared_flags_are_visible_to_other_processes():
+    async def main():
+        storage = MemoryStorage()
+        first = UiFlags(storage=storage, bot_id=42)
+        second = UiFlags(storage=storage, bot_id=42)
+        await first.set(1, "hidden", True)
+        assert await second.get(1, "hidden", False) is True
+        await second.reset(1, "hidden")
+        assert await first.get(1, "hidden", False) is False
+        # Данные сценария FSM пользователя флаги не трогают
+        assert await storage.get_data(StorageKey(bot_id=42, chat_id=1, user_id=1)) == {}
+    asyncio.run(main())
+
+class JsonbLikeStorage(MemoryStorage):
+    """Сохраняет данные через JSON и, как JSONB, отдаёт ключи по длине, а не в порядке записи."""
+
+    async def set_data(self, key, data):
+        data = json.loads(json.dumps(data))
+        await super().set_data(key, dict(sorted(data.items(), key=lambda item: (len(item[0].encode()), item[0].encode()))))
+
+def test_shared_flags_keep_latest_per_user():
+    async def main():
+        flags = UiFlags(storage=JsonbLikeStorage(), bot_id=42, max_per_user=2)
+        for name in ("a", "bbb", "a", "cc"):
+            await flags.set(1, name, True)
+            await asyncio.sleep(0.001)
+        first = [await flags.get(1, name) for name in ("a", "bbb", "cc")]
+        # Самый новый флаг с самым длинным именем не должен вытесняться из-за порядка ключей
+        await flags.set(1, "dddd", True)
+        second = [await flags.get(1, name) for name in ("a", "bbb", "cc", "dddd")]
+        return first, second
+    first, second = asyncio.run(main())
+    assert first == [True, None, True]
+    assert second == [None, None, True, True]
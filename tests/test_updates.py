@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+from app.services.updates import UpdateTracker, stale_callbacks
+
+USER = User(id=1, is_bot=False, first_name="Тест")
+
+def _message(update_id: int, age: float) -> Update:
+    sent = datetime.now(timezone.utc) - timedelta(seconds=age)
+    return Update(update_id=update_id, message=Message(message_id=update_id, date=sent, chat=Chat(id=1, type="private"), text="x"))
+
+def _callback(update_id: int) -> Update:
+    return Update(update_id=update_id, callback_query=CallbackQuery(id=str(update_id), from_user=USER, chat_instance="x", data="x"))
+
+def test_watermark_waits_for_oldest_update():
+    tracker = UpdateTracker(None, bot_id=1)
+    for update_id in (10, 11, 12):
+        assert tracker.begin(update_id)
+    tracker.done(12)
+    tracker.done(11)
+    assert tracker.offset == 9
+    tracker.done(10)
+    assert tracker.offset == 12
+
+def test_watermark_does_not_pass_update_in_lane_queue():
+    tracker = UpdateTracker(None, bot_id=1)
+    # 10 ещё ждёт своей очереди, а 11 и 12 уже обработаны
+    for update_id in (10, 11, 12):
+        tracker.begin(update_id)
+    tracker.done(11)
+    tracker.begin(13)
+    tracker.done(12)
+    tracker.done(13)
+    assert tracker.offset == 9
+    tracker.done(10)
+    assert tracker.offset == 13
+
+def test_duplicates_and_restored_offset():
+    tracker = UpdateTracker(None, bot_id=1)
+    tracker.restored = tracker.offset = tracker.max_seen = 100
+    assert not tracker.begin(100)
+    assert tracker.begin(101)
+    assert not tracker.begin(101)
+    tracker.done(101)
+    assert tracker.offset == 101 and tracker.duplicates == 2
+
+def test_skip_moves_watermark():
+    tracker = UpdateTracker(None, bot_id=1)
+    tracker.skip(5)
+    assert tracker.offset == 5 and not tracker.in_flight
+
+def test_stale_callbacks():
+    updates = [_callback(1), _message(2, age=600), _callback(3), _message(4, age=5), _callback(5)]
+    assert stale_callbacks(updates, max_age=60) == {1}
+
+def test_callbacks_without_newer_dated_updates_are_fresh():
+    assert stale_callbacks([_message(1, age=600), _callback(2)], max_age=60) == set()
+
+def test_stale_callback_uses_oldest_newer_date():
+    # Ранний колбэк не моложе самого старого датированного апдейта после него
+    updates = [_callback(1), _message(2, age=600), _message(3, age=5)]
+    assert stale_callbacks(updates, max_age=60) == {1}
+
+class FakeBot:
+    def __init__(self, pending: list[Update]):
+        self.pending = pending
+        self.offsets = []
+
+    async def get_updates(self, offset, limit, timeout, allowed_updates):
+        self.offsets.append(offset)
+        # Как Telegram: всё ниже offset подтверждено и больше не приходит
+        self.pending = [update for update in self.pending if update.update_id >= offset]
+        if not self.pending:
+            await asyncio.sleep(timeout)
+        return self.pending[:limit]
+
+class FakeDispatcher:
+    def __init__(self, slow: int):
+        self.slow = slow
+        self.release = asyncio.Event()
+        self.fed = []
+
+    async def feed_update(self, bot, update):
+        self.fed.append(update.update_id)
+        if update.update_id == self.slow:
+            await self.release.wait()
+
+def test_poll_confirms_only_processed_updates():
+    async def main():
+        bot = FakeBot([_message(update_id, age=0) for update_id in (1, 2, 3)])
+        dispatcher = FakeDispatcher(slow=2)
+        tracker = UpdateTracker(None, bot_id=1)
+        task = asyncio.create_task(tracker.poll(bot, dispatcher, polling_timeout=0.05))
+        await asyncio.sleep(0.2)
+        # Пока 2 в работе, Telegram не получает offset выше 2
+        assert max(bot.offsets) == 2
+        bot.pending.append(_message(4, age=0))
+        await asyncio.sleep(0.1)
+        assert max(bot.offsets) == 2
+        dispatcher.release.set()
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return bot, dispatcher, tracker
+    bot, dispatcher, tracker = asyncio.run(main())
+    assert sorted(dispatcher.fed) == [1, 2, 3, 4]
+    assert tracker.offset == 4 and max(bot.offsets) == 5
+    # Повторно присланные апдейты в работе не обрабатываются второй раз и не крутят getUpdates
+    assert len(bot.offsets) < 20
+
+def test_poll_finishes_started_updates_on_cancel():
+    async def main():
+        bot = FakeBot([_message(1, age=0)])
+        dispatcher = FakeDispatcher(slow=1)
+        tracker = UpdateTracker(None, bot_id=1)
+        task = asyncio.create_task(tracker.poll(bot, dispatcher, polling_timeout=0.05))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        dispatcher.release.set()
+        await asyncio.gather(task, return_exceptions=True)
+        return tracker
+    assert asyncio.run(main()).offset == 1